@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+#
+# aggregator.py
+#
+# Optional multi-node mode. Other canaries forward their OpenCanary events
+# here over UDP or TCP and this node stores, indexes, charts and alerts on
+# all of them. Accepted on both transports:
+#   raw JSON lines                     {"dst_host": ..., "node_id": ...}
+#   syslog-framed (RFC 3164/5424)      <134>Jul 30 14:08:23 host opencanaryd: {...}
+#   TCP octet-counted framing          123 <134>...
+# so a sender can use OpenCanary's own SysLogHandler, rsyslog forwarding or
+# a plain socket. Events without a node_id are filed under the sender's IP.
+# This node's own log (LOG_PATH) is followed as well, so "All nodes" includes
+# it without forwarding to itself. A line already in the index (a node that
+# does forward to itself, or a sender re-sending) is stored only once.
+#
+# The asyncio loop only frames messages and queues them; a writer thread
+# drains the queue in batches into per-node daily partitions (NODE_DIR), the
+# SQLite index and rollups the dashboard reads in "All nodes" mode, and the
+# alert rules from settings.conf (except for local lines: alerting.py already
+# covers those). When the queue backs up, TCP senders are
+# paused (pause_reading) and UDP datagrams beyond QUEUE_MAX are dropped and
+# counted.
+#
+# Settings live in settings.conf "aggregator":
+#   {"enabled": true, "bind": "0.0.0.0", "udp_port": 5140, "tcp_port": 5140}
+# (a null port disables that transport; 0 picks a free port)
+#
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import shutil
+import signal
+import socket
+import asyncio
+import datetime
+import threading
+from itertools import islice
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+import alerting
+from utils import (
+    get_setting, load_json, save_json, SETTINGS_FILE, LOG_PATH,
+    NODE_DIR, NODE_INDEX_FILE, NODE_ROLLUP_FILE, NODE_STATUS
+)
+from logstore import LogEvent, LogFollower, decode_line, event_from_obj
+from logquery import LogIndex
+from rollup import RollupStore
+
+DEFAULTS = {"enabled": False, "bind": "0.0.0.0", "udp_port": 5140, "tcp_port": 5140}
+BATCH_MAX        = 20000               # messages per writer batch (one index transaction)
+BATCH_INTERVAL   = 0.1                 # secs the writer idles when the queue is empty
+QUEUE_MAX        = 200000              # messages waiting for the writer; UDP drops beyond
+PAUSE_AT         = QUEUE_MAX // 2      # TCP reading pauses above this...
+RESUME_AT        = QUEUE_MAX // 8      # ...and resumes below this
+MAX_MESSAGE      = 64 * 1024           # longer TCP lines are discarded
+UDP_RCVBUF       = 64 * 1024 * 1024    # bytes; absorbs bursts while the writer holds the GIL
+SO_RCVBUFFORCE   = getattr(socket, "SO_RCVBUFFORCE", 33)   # Linux; ignores rmem_max with CAP_NET_ADMIN
+STATUS_INTERVAL  = 2.0                 # secs between status snapshots
+MAINT_INTERVAL   = 3600                # secs between compaction/expiry passes
+OPEN_PARTITIONS  = 64                  # append handles kept open
+MAX_NODES        = 1024                # distinct node_ids tracked; events from more are dropped
+MAX_NODE_NAME    = 100                 # chars of a node_id used for its directory name
+ALERT_INTERVAL   = 1.0                 # secs between alert deliveries
+ALERT_QUEUE_FILE = "/app/aggregator-alert-queue.jsonl"
+LOCAL_PEER       = "local"               # peer recorded for lines from this node's own log
+RE_OCTET = re.compile(rb"(\d{1,6}) <")
+RE_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+terminate = False
+
+def handler(signum, frame):
+    global terminate
+    print("[*] Received signal to terminate. Exiting cleanly...")
+    terminate = True
+
+def now_str() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def read_settings() -> dict:
+    cfg = dict(DEFAULTS)
+    saved = get_setting("aggregator", {})
+    if isinstance(saved, dict):
+        cfg.update(saved)
+    return cfg
+
+# ——— Messages ————————————————————————————————————————————————————
+
+def parse_message(data: bytes, peer: str) -> Optional[Tuple[str, dict, str]]:
+    """
+    (node_id, event, JSON line) from one forwarded message, or None if it
+    carries no JSON object. Any syslog header before the "{" is ignored.
+    """
+    if data[:1] == b"{":
+        line = decode_line(data).rstrip()        # raw JSON line: the common case
+    else:
+        text = decode_line(data).strip()
+        start = text.find("{")
+        if start < 0:
+            return None
+        line = text[start:]
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(obj, dict):
+        return None
+    return str(obj.get("node_id") or peer), obj, line
+
+def _split(batch: List[Tuple[bytes, str]]):
+    # UDP datagrams arrive whole; one may carry several newline-separated lines
+    for msg, peer in batch:
+        if b"\n" in msg.rstrip(b"\n"):
+            for part in msg.split(b"\n"):
+                if part.strip():
+                    yield part, peer
+        elif msg.strip():
+            yield msg, peer
+
+class Framer:
+    """
+    Split a TCP byte stream into messages: octet-counted ("<len> <msg>")
+    if the stream starts that way, newline-delimited otherwise.
+    """
+
+    def __init__(self):
+        self.buf = b""
+        self.octet: Optional[bool] = None
+        self.oversized = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        buf = self.buf + data
+        if self.octet is None:
+            if not buf:
+                return []
+            if buf[:1].isdigit():
+                if len(buf) < 8 and b"<" not in buf:
+                    self.buf = buf
+                    return []
+                self.octet = RE_OCTET.match(buf) is not None
+            else:
+                self.octet = False
+        out = []
+        if self.octet:
+            pos = 0
+            while True:
+                m = RE_OCTET.match(buf, pos)
+                if m is None:
+                    break
+                start = m.end() - 1
+                end = start + int(m.group(1))
+                if end > len(buf):
+                    break
+                out.append(buf[start:end])
+                pos = end
+                while pos < len(buf) and buf[pos:pos + 1] in (b"\n", b" "):
+                    pos += 1
+            self.buf = buf[pos:]
+        else:
+            parts = buf.split(b"\n")
+            self.buf = parts.pop()
+            out = [p for p in parts if p.strip()]
+        if len(self.buf) > MAX_MESSAGE:
+            self.buf = b""
+            self.oversized += 1
+        return out
+
+# ——— Partitioned store ———————————————————————————————————————————
+
+class NodeStore:
+    """
+    Append-only JSON-line partitions, one file per node per day:
+    NODE_DIR/<node_id>/<YYYY-mm-dd>.log, gzipped once the day is over.
+    """
+
+    def __init__(self, root: str = NODE_DIR):
+        self.root = root
+        self._files: "OrderedDict[Tuple[str, str], object]" = OrderedDict()
+
+    def path(self, node: str, day: str) -> str:
+        name = RE_UNSAFE.sub("_", node)[:MAX_NODE_NAME]
+        if not name or name.startswith("."):
+            name = "_" + name           # never "", "." or ".." (node_ids are sender-controlled)
+        return os.path.join(self.root, name, f"{day}.log")
+
+    def append(self, node: str, day: str, data: str) -> None:
+        """
+        Raises ValueError if the partition would resolve outside the root
+        (e.g. through a symlink).
+        """
+        key = (node, day)
+        f = self._files.pop(key, None)
+        if f is None:
+            path = self.path(node, day)
+            root = os.path.realpath(self.root)
+            if os.path.commonpath([root, os.path.realpath(path)]) != root:
+                raise ValueError(f"partition for node {node!r} resolves outside {self.root}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path, "a", encoding="utf-8")
+            if len(self._files) >= OPEN_PARTITIONS:
+                self._files.popitem(last=False)[1].close()
+        self._files[key] = f
+        f.write(data)
+
+    def flush(self) -> None:
+        for f in self._files.values():
+            f.flush()
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def partitions(self) -> List[Tuple[str, str, str]]:
+        """
+        (node dir, day, path) for every partition file, oldest day first.
+        """
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for node in os.listdir(self.root):
+            d = os.path.join(self.root, node)
+            if not os.path.isdir(d):
+                continue
+            for name in os.listdir(d):
+                day = name.split(".", 1)[0]
+                if name.endswith((".log", ".log.gz")):
+                    out.append((node, day, os.path.join(d, name)))
+        return sorted(out, key=lambda p: (p[1], p[0]))
+
+    def compact(self, today: str) -> int:
+        """
+        Gzip plain partitions of days before `today`; returns how many. Late
+        events for a compacted day are appended as another gzip member.
+        """
+        for key in [k for k in self._files if k[1] < today]:
+            self._files.pop(key).close()
+        done = 0
+        for _, day, path in self.partitions():
+            if day >= today or not path.endswith(".log"):
+                continue
+            gz = path + ".gz"
+            if os.path.exists(gz):
+                with open(path, "rb") as src, open(gz, "ab") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            else:
+                with open(path, "rb") as src, gzip.open(gz + ".tmp", "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(gz + ".tmp", gz)
+            os.remove(path)
+            done += 1
+        return done
+
+    def expire(self, oldest: str) -> int:
+        """
+        Delete partitions of days before `oldest`; returns how many.
+        """
+        removed = 0
+        for _, day, path in self.partitions():
+            if day < oldest:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+# ——— Ingest server ———————————————————————————————————————————————
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, agg: "Aggregator"):
+        self.agg = agg
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        # Only enqueue: the loop must get back to the socket before its buffer
+        # fills. Datagrams holding several lines are split by the writer.
+        self.agg.submit(data, addr[0])
+
+class _TcpProtocol(asyncio.Protocol):
+    def __init__(self, agg: "Aggregator"):
+        self.agg = agg
+        self.framer = Framer()
+        self.peer = ""
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        peer = transport.get_extra_info("peername")
+        self.peer = peer[0] if peer else ""
+        self.agg.connections.add(self)
+        if self.agg.paused:
+            transport.pause_reading()
+
+    def connection_lost(self, exc) -> None:
+        self.agg.connections.discard(self)
+        self.agg.oversized += self.framer.oversized
+
+    def data_received(self, data: bytes) -> None:
+        for msg in self.framer.feed(data):
+            self.agg.submit(msg, self.peer, block=True)
+
+class Aggregator:
+    def __init__(self, bind: str = DEFAULTS["bind"], udp_port: Optional[int] = DEFAULTS["udp_port"],
+                 tcp_port: Optional[int] = DEFAULTS["tcp_port"], store_dir: str = NODE_DIR,
+                 index_path: str = NODE_INDEX_FILE, rollup_path: str = NODE_ROLLUP_FILE,
+                 status_path: Optional[str] = NODE_STATUS, settings_path: Optional[str] = SETTINGS_FILE,
+                 alert_queue: str = ALERT_QUEUE_FILE, local_log: Optional[str] = LOG_PATH):
+        self.bind = bind
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.status_path = status_path
+        self.settings_path = settings_path
+        self.alert_queue = alert_queue
+        self.store = NodeStore(store_dir)
+        self.index = LogIndex(index_path)
+        self.rollups = RollupStore(rollup_path)
+        # this node's log; the position read so far is kept in the index
+        self.local: Optional[LogFollower] = None
+        if local_log:
+            saved = self.index.get_meta("local_inode", "local_offset")
+            inode = saved.get("local_inode")
+            self.local = LogFollower(local_log, int(saved.get("local_offset") or 0),
+                                     int(inode) if inode else None)
+        self._next_local = 0.0
+
+        self.pending: deque = deque()
+        self.connections = set()
+        self.paused = False
+        # counters: received/dropped/oversized on the loop, the rest on the writer
+        self.received = 0
+        self.dropped = 0
+        self.oversized = 0
+        self.stored = 0
+        self.dropped_nodes = 0    # events refused by the MAX_NODES cap (or an unsafe partition)
+        self.malformed = 0
+        self.duplicates = 0
+        # per-node counters carry over restarts through the status snapshot
+        self.nodes: Dict[str, dict] = load_json(status_path).get("nodes", {}) if status_path else {}
+
+        self.engine = alerting.AlertEngine({})
+        self._engine_lock = threading.Lock()
+        self._settings_mtime = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._servers = []
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._last_maint = 0.0
+        self._last_status = 0.0
+        self._last_rate = (time.monotonic(), 0)
+        self.rate = 0.0
+
+    # ─── Event loop side ────────────────────────────────────────────────────────
+    def submit(self, msg: bytes, peer: str, block: bool = False) -> None:
+        """
+        Queue one framed message. TCP (block=True) is paused instead of
+        dropped when the writer falls behind.
+        """
+        if len(self.pending) >= QUEUE_MAX and not block:
+            self.dropped += 1
+            return
+        self.pending.append((msg, peer))
+        self.received += 1
+        if not self.paused and len(self.pending) >= PAUSE_AT:
+            self.paused = True
+            for conn in self.connections:
+                conn.transport.pause_reading()
+
+    def _resume(self) -> None:
+        if self.paused and len(self.pending) < RESUME_AT:
+            self.paused = False
+            for conn in self.connections:
+                conn.transport.resume_reading()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self.udp_port is not None:
+            transport, _ = await self._loop.create_datagram_endpoint(
+                lambda: _UdpProtocol(self), local_addr=(self.bind, self.udp_port))
+            sock = transport.get_extra_info("socket")
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, UDP_RCVBUF)
+            except OSError:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
+                except OSError:
+                    pass
+            rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            if rcvbuf < UDP_RCVBUF:
+                print(f"[WARN] UDP receive buffer is {rcvbuf} bytes (capped by net.core.rmem_max); "
+                      f"bursts may be dropped")
+            self.udp_port = transport.get_extra_info("sockname")[1]
+            self._servers.append(transport)
+        if self.tcp_port is not None:
+            server = await self._loop.create_server(lambda: _TcpProtocol(self), self.bind, self.tcp_port)
+            self.tcp_port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+        for target in (self._writer, self._alerter):
+            t = threading.Thread(target=target, daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"[{now_str()}] Aggregator listening on {self.bind} udp/{self.udp_port} tcp/{self.tcp_port}")
+
+    async def stop(self) -> None:
+        for s in self._servers:
+            s.close()
+        for conn in list(self.connections):
+            conn.transport.close()
+        self._stop.set()
+        await self._loop.run_in_executor(None, self._join)
+
+    def _join(self) -> None:
+        for t in self._threads:
+            t.join()
+        self.store.close()
+        self.rollups.save()
+        self.write_status()
+
+    # ─── Writer thread ──────────────────────────────────────────────────────────
+    def _writer(self) -> None:
+        pending = self.pending
+        while True:
+            local = self._read_local()
+            if not pending:
+                if self._stop.is_set():
+                    break
+                self._housekeeping()
+                if not local:
+                    time.sleep(BATCH_INTERVAL)
+                continue
+            n = min(BATCH_MAX, len(pending))
+            batch = [pending.popleft() for _ in range(n)]
+            try:
+                self.process(batch)
+            except Exception as e:
+                print(f"[!] Failed to store batch of {n}: {e}")
+            if self.paused and len(pending) < RESUME_AT:
+                self._loop.call_soon_threadsafe(self._resume)
+            self._housekeeping()
+
+    def _read_local(self) -> int:
+        """
+        process() up to BATCH_MAX lines appended to this node's own log;
+        returns how many. Polled every BATCH_INTERVAL unless behind.
+        """
+        follower = self.local
+        if follower is None or time.monotonic() < self._next_local:
+            return 0
+        follower.sync()
+        lines = list(islice(follower.read_lines(), BATCH_MAX))
+        self._next_local = 0.0 if len(lines) == BATCH_MAX else time.monotonic() + BATCH_INTERVAL
+        if not lines:
+            return 0
+        try:
+            self.process([(raw, LOCAL_PEER) for _, raw in lines])
+        except Exception as e:
+            print(f"[!] Failed to store {len(lines)} local line(s): {e}")
+        self.index.set_meta(local_inode=follower.inode, local_offset=follower.offset)
+        return len(lines)
+
+    def process(self, batch: List[Tuple[bytes, str]]) -> None:
+        now = time.time()
+        today = datetime.date.today().isoformat()
+        events: List[LogEvent] = []
+        origin: Dict[int, Tuple[dict, str]] = {}
+        nodes = self.nodes
+        admitted = set()            # nodes first seen in this batch
+        for msg, peer in _split(batch):
+            parsed = parse_message(msg, peer)
+            if parsed is None:
+                self.malformed += 1
+                continue
+            node, obj, line = parsed
+            if node not in nodes and node not in admitted:
+                if len(nodes) + len(admitted) >= MAX_NODES:
+                    self.dropped_nodes += 1
+                    continue
+                admitted.add(node)
+            ev = event_from_obj(0, obj, line)
+            if ev.node_id != node:
+                ev = ev._replace(node_id=node)      # filed under the sender's IP
+            events.append(ev)
+            origin[id(ev)] = (obj, peer)
+        fresh = self.index.add_new(events)
+        self.duplicates += len(events) - len(fresh)
+        parts: Dict[Tuple[str, str], List[str]] = {}
+        engine = self.engine if self.engine.enabled else None
+        matched = []
+        for ev in fresh:
+            obj, peer = origin[id(ev)]
+            node = ev.node_id
+            day = ev.ts.date().isoformat() if ev.ts is not None else today
+            part = parts.get((node, day))
+            if part is None:
+                part = parts[(node, day)] = []
+            part.append(ev.line + "\n")
+            info = nodes.get(node)
+            if info is None:
+                info = nodes[node] = {"events": 0, "last_seen": 0.0, "peer": peer}
+            info["events"] += 1
+            info["last_seen"] = now
+            info["peer"] = peer
+            if engine is not None and peer != LOCAL_PEER:
+                matched.append((ev.line, obj))
+        for (node, day), lines in parts.items():
+            try:
+                self.store.append(node, day, "".join(lines))
+            except ValueError as e:
+                print(f"[WARN] {e}")
+                self.dropped_nodes += len(lines)
+        self.store.flush()
+        self.rollups.add(fresh)
+        self.stored += len(fresh)
+        if matched:
+            mono = time.monotonic()     # the alert engine's clock, as in alerting.run
+            with self._engine_lock:
+                for line, obj in matched:
+                    engine.feed(line, mono, obj)
+
+    def _housekeeping(self) -> None:
+        now = time.monotonic()
+        if now - self._last_status >= STATUS_INTERVAL:
+            self._reload_alerts()
+            self.rollups.save_if_due()
+            self.write_status()
+            self._last_status = now
+        if now - self._last_maint >= MAINT_INTERVAL:
+            self._last_maint = now
+            self.maintain()
+
+    def maintain(self) -> None:
+        today = datetime.date.today()
+        packed = self.store.compact(today.isoformat())
+        days = get_setting("logman.log_expiry", None)
+        expired = 0
+        if isinstance(days, (int, float)) and days > 0:
+            expired = self.store.expire((today - datetime.timedelta(days=days)).isoformat())
+            # Nodes silent for longer than that free their MAX_NODES slot
+            cutoff = time.time() - days * 86400
+            for node in [n for n, info in self.nodes.items() if info["last_seen"] < cutoff]:
+                del self.nodes[node]
+        self.index.prune_if_due()
+        if packed or expired:
+            print(f"[{now_str()}] Compacted {packed} partition(s), expired {expired}")
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        last_t, last_n = self._last_rate
+        if now > last_t:
+            self.rate = (self.stored - last_n) / (now - last_t)
+        self._last_rate = (now, self.stored)
+        return {
+            "updated": time.time(),
+            "udp_port": self.udp_port,
+            "tcp_port": self.tcp_port,
+            "received": self.received,
+            "stored": self.stored,
+            "malformed": self.malformed,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped + self.dropped_nodes,
+            "oversized": self.oversized,
+            "queued": len(self.pending),
+            "paused": self.paused,
+            "connections": len(self.connections),
+            "events_per_sec": round(self.rate, 1),
+            "nodes": {k: dict(v) for k, v in self.nodes.items()},
+        }
+
+    def write_status(self) -> None:
+        if not self.status_path:
+            return
+        try:
+            save_json(self.status_path, self.status(), indent=None)
+        except OSError as e:
+            print(f"[WARN] Could not write {self.status_path}: {e}")
+
+    # ─── Alerts ─────────────────────────────────────────────────────────────────
+    def _reload_alerts(self) -> None:
+        if not self.settings_path:
+            return
+        try:
+            mtime = os.stat(self.settings_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._settings_mtime:
+            return
+        self._settings_mtime = mtime
+        cfg = alerting.read_config(self.settings_path)
+        if cfg is None:
+            print(f"[WARN ] Invalid JSON in {self.settings_path}; using previous alert settings", file=sys.stderr)
+            return
+        engine = alerting.AlertEngine(cfg)
+        with self._engine_lock:
+            self.engine = engine
+        state = "ON" if engine.enabled else "OFF"
+        print(f"[{now_str()}] Alerting {state}; {len(engine.rules)} rule(s) across all nodes")
+
+    def _alerter(self) -> None:
+        # Deliveries block on HTTP; keep them off the writer thread
+        client = alerting.HttpClient()
+        queue = alerting.RetryQueue(self.alert_queue)
+        next_retry = 0.0
+        while not self._stop.wait(ALERT_INTERVAL):
+            with self._engine_lock:
+                due = self.engine.due(time.monotonic())
+            alerting.deliver(due, client, queue)
+            if time.monotonic() >= next_retry:
+                queue.flush(client)
+                next_retry = time.monotonic() + alerting.RETRY_INTERVAL
+
+async def serve(cfg: dict) -> None:
+    ports = [None if cfg[k] is None else int(cfg[k]) for k in ("udp_port", "tcp_port")]
+    agg = Aggregator(cfg["bind"], *ports)
+    await agg.start()
+    while not terminate:
+        await asyncio.sleep(0.5)
+    await agg.stop()
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    cfg = read_settings()
+    if not cfg.get("enabled"):
+        print("[*] Aggregator disabled in settings.conf; nothing to do")
+        sys.exit(0)
+    try:
+        asyncio.run(serve(cfg))
+    except Exception as e:
+        print(f"[!] Unhandled exception: {e}")
+        raise
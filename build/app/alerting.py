@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+#
+# alerting.py
+#
+# Follows the OpenCanary JSON-line log (tail -F style) and posts alerts to a
+# webhook or ntfy endpoint. Only lines written after startup are considered.
+#
+# Settings are read from settings.conf "config" and re-read when it changes:
+#   alert, alert_strings, alert_method, webhook_url, alert_message
+# plus optional field-aware rules in "alert_rules", e.g.
+#   {"name": "ssh", "logtype": [4002], "src_host": "10.0.0.0/8",
+#    "strings": ["root"], "batch_seconds": 5, "dedup_seconds": 300,
+#    "max_per_minute": 6, "alert_method": "ntfy", "webhook_url": "..."}
+#
+import os
+import re
+import sys
+import json
+import time
+import signal
+import datetime
+import ipaddress
+import http.client
+import urllib.parse
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import load_json, LOG_PATH, SETTINGS_FILE
+from logstore import LogFollower, decode_line, parse_time
+
+POLL_INTERVAL  = 0.2     # secs between log/settings checks
+RETRY_INTERVAL = 30      # secs between retry-queue flush attempts
+QUEUE_FILE     = "/app/alert-queue.jsonl"
+QUEUE_MAX      = 500     # undelivered alerts kept on disk, oldest dropped first
+PENDING_MAX    = 1000    # matched lines held per rule while rate limited
+HTTP_TIMEOUT   = 10
+SEEN_MAX       = 100000  # recent lines remembered to skip re-reads after truncation
+
+terminate = False
+
+def handler(signum, frame):
+    global terminate
+    print("[*] Received signal to terminate. Exiting cleanly...")
+    terminate = True
+
+def now_str() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+# ——— Multi-pattern matcher ———————————————————————————————————————————
+
+class Matcher:
+    """
+    Find which of many literal strings occur in a line. One compiled
+    alternation (scanned in C) rejects the common non-matching line; only
+    lines with a hit are checked pattern by pattern, so overlapping and
+    nested patterns are all reported.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = [p for p in dict.fromkeys(patterns) if p]
+        # Longest first, so a pattern is never shadowed by its own prefix
+        alternation = "|".join(re.escape(p) for p in sorted(self.patterns, key=len, reverse=True))
+        self._any = re.compile(alternation) if self.patterns else None
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def search(self, text: str) -> set:
+        """
+        Indexes (into self.patterns) of every pattern found in text.
+        """
+        if self._any is None or self._any.search(text) is None:
+            return set()
+        return {i for i, p in enumerate(self.patterns) if p in text}
+
+# ——— Rules ————————————————————————————————————————————————————
+
+class Rule:
+    def __init__(self, spec: dict, defaults: dict):
+        self.name = str(spec.get("name") or "alert_strings")
+        self.strings = [str(s) for s in spec.get("strings", []) if str(s)]
+        lt = spec.get("logtype")
+        self.logtypes = None if lt in (None, "", []) else {str(x) for x in (lt if isinstance(lt, list) else [lt])}
+        nodes = spec.get("node_id")
+        self.node_ids = None if nodes in (None, "", []) else {str(x) for x in (nodes if isinstance(nodes, list) else [nodes])}
+        net = spec.get("src_host")
+        self.networks = []
+        for n in (net if isinstance(net, list) else [net] if net else []):
+            try:
+                self.networks.append(ipaddress.ip_network(str(n), strict=False))
+            except ValueError:
+                print(f"[WARN] Rule {self.name}: invalid src_host {n!r}; ignored")
+        self.batch_seconds  = float(spec.get("batch_seconds", 0))
+        self.dedup_seconds  = float(spec.get("dedup_seconds", 0))
+        self.max_per_minute = int(spec.get("max_per_minute", 0))
+        self.method  = spec.get("alert_method") or defaults.get("alert_method", "webhook")
+        self.url     = spec.get("webhook_url") or defaults.get("webhook_url", "")
+        self.message = spec.get("alert_message") or defaults.get("alert_message", "")
+
+        self.pending: List[str] = []
+        self.first_pending = 0.0
+        self.sent_times: deque = deque()
+        self.seen: Dict[Any, float] = {}
+        self.dropped = 0
+
+    def fields_match(self, obj: dict) -> bool:
+        if self.logtypes is not None and str(obj.get("logtype")) not in self.logtypes:
+            return False
+        if self.node_ids is not None and str(obj.get("node_id")) not in self.node_ids:
+            return False
+        if self.networks:
+            try:
+                addr = ipaddress.ip_address(str(obj.get("src_host", "")))
+            except ValueError:
+                return False
+            if not any(addr in net for net in self.networks):
+                return False
+        return True
+
+    def is_duplicate(self, obj: dict, now: float) -> bool:
+        if self.dedup_seconds <= 0:
+            return False
+        key = (obj.get("logtype"), obj.get("src_host"), obj.get("dst_port"), obj.get("node_id"))
+        last = self.seen.get(key)
+        self.seen[key] = now
+        if len(self.seen) > 10000:
+            cutoff = now - self.dedup_seconds
+            self.seen = {k: t for k, t in self.seen.items() if t >= cutoff}
+        return last is not None and now - last < self.dedup_seconds
+
+    def queue(self, line: str, now: float) -> None:
+        if not self.pending:
+            self.first_pending = now
+        self.pending.append(line)
+        if len(self.pending) > PENDING_MAX:
+            del self.pending[0]
+            self.dropped += 1
+
+    def take_batch(self, now: float) -> List[str]:
+        """
+        Pending lines if the batch window has elapsed and the rate limit allows.
+        """
+        if not self.pending or now - self.first_pending < self.batch_seconds:
+            return []
+        if self.max_per_minute > 0:
+            while self.sent_times and now - self.sent_times[0] >= 60:
+                self.sent_times.popleft()
+            if len(self.sent_times) >= self.max_per_minute:
+                return []
+            self.sent_times.append(now)
+        batch, self.pending = self.pending, []
+        return batch
+
+class AlertEngine:
+    """
+    Match log lines against every rule in one pass per line. String rules
+    share one Matcher; field conditions are only checked on JSON lines.
+    """
+
+    def __init__(self, cfg: dict):
+        self.enabled = cfg.get("alert") is True
+        self.rules: List[Rule] = []
+        strings = [str(s) for s in cfg.get("alert_strings", []) or [] if str(s)]
+        if strings:
+            self.rules.append(Rule({"name": "alert_strings", "strings": strings}, cfg))
+        for spec in cfg.get("alert_rules", []) or []:
+            if isinstance(spec, dict):
+                self.rules.append(Rule(spec, cfg))
+        all_strings = [s for r in self.rules for s in r.strings]
+        self.matcher = Matcher(all_strings)
+        pat_index = {p: i for i, p in enumerate(self.matcher.patterns)}
+        self._rule_pats = [{pat_index[s] for s in r.strings} for r in self.rules]
+
+    def feed(self, line: str, now: float, obj: Optional[dict] = None) -> None:
+        """
+        Queue `line` on every rule it matches. `obj` is the decoded line, if
+        the caller already has it.
+        """
+        found = self.matcher.search(line) if self.matcher else set()
+        for rule, pats in zip(self.rules, self._rule_pats):
+            if pats and not (pats & found):
+                continue
+            has_fields = rule.logtypes is not None or rule.networks or rule.node_ids is not None
+            if not pats and not has_fields:
+                continue   # a rule with no strings and no fields matches nothing
+            if has_fields or rule.dedup_seconds > 0:
+                if obj is None:
+                    try:
+                        obj = json.loads(line)
+                    except (json.JSONDecodeError, ValueError):
+                        obj = {}
+                    if not isinstance(obj, dict):
+                        obj = {}
+                if not rule.fields_match(obj) or rule.is_duplicate(obj, now):
+                    continue
+            rule.queue(line, now)
+
+    def due(self, now: float) -> List[Tuple[Rule, List[str]]]:
+        out = []
+        for rule in self.rules:
+            batch = rule.take_batch(now)
+            if batch:
+                out.append((rule, batch))
+        return out
+
+# ——— Delivery ————————————————————————————————————————————————————
+
+class HttpClient:
+    """
+    Keep-alive connections reused per (scheme, host, port).
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT):
+        self.timeout = timeout
+        self._conns: Dict[Tuple[str, str, int], http.client.HTTPConnection] = {}
+
+    def _conn(self, scheme: str, host: str, port: int) -> http.client.HTTPConnection:
+        key = (scheme, host, port)
+        conn = self._conns.get(key)
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = self._conns[key] = cls(host, port, timeout=self.timeout)
+        return conn
+
+    def post(self, url: str, body: bytes, content_type: str) -> bool:
+        u = urllib.parse.urlsplit(url)
+        if u.scheme not in ("http", "https") or not u.hostname:
+            print(f"[WARN] Invalid alert URL: {url!r}")
+            return False
+        port = u.port or (443 if u.scheme == "https" else 80)
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        headers = {"Content-Type": content_type, "Connection": "keep-alive"}
+        for attempt in (1, 2):
+            conn = self._conn(u.scheme, u.hostname, port)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.will_close:
+                    conn.close()
+                    self._conns.pop((u.scheme, u.hostname, port), None)
+                return 200 <= resp.status < 300
+            except (OSError, http.client.HTTPException) as e:
+                # Stale keep-alive connection: reconnect once
+                conn.close()
+                self._conns.pop((u.scheme, u.hostname, port), None)
+                if attempt == 2:
+                    print(f"[WARN] Alert delivery to {u.hostname} failed: {e}")
+        return False
+
+class RetryQueue:
+    """
+    Undelivered alerts as JSON lines on disk, bounded to QUEUE_MAX entries.
+    """
+
+    def __init__(self, path: str = QUEUE_FILE, limit: int = QUEUE_MAX):
+        self.path = path
+        self.limit = limit
+
+    def _load(self) -> List[dict]:
+        items = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        items.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return items
+
+    def _save(self, items: List[dict]) -> None:
+        items = items[-self.limit:]
+        if not items:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def push(self, item: dict) -> None:
+        try:
+            self._save(self._load() + [item])
+        except OSError as e:
+            print(f"[WARN] Could not queue alert for retry: {e}")
+
+    def flush(self, client: HttpClient) -> None:
+        items = self._load()
+        if not items:
+            return
+        remaining = []
+        for i, item in enumerate(items):
+            if not client.post(item["url"], item["body"].encode("utf-8"), item["content_type"]):
+                remaining = items[i:]   # endpoint still down; keep order
+                break
+        try:
+            self._save(remaining)
+        except OSError:
+            pass
+
+def build_request(rule: Rule, batch: List[str]) -> Optional[dict]:
+    # Same payloads as the former alert.sh
+    if rule.method == "webhook":
+        body = json.dumps({
+            "timestamp": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+            "message": rule.message,
+            "matches": batch,
+        })
+        return {"url": rule.url, "body": body, "content_type": "application/json"}
+    if rule.method == "ntfy":
+        return {"url": rule.url, "body": rule.message, "content_type": "text/plain; charset=utf-8"}
+    print(f"[WARN] Unknown alert_method: {rule.method}")
+    return None
+
+def deliver(due: List[Tuple[Rule, List[str]]], client: HttpClient, queue: RetryQueue) -> None:
+    for rule, batch in due:
+        if rule.dropped:
+            print(f"[WARN] Rule {rule.name}: {rule.dropped} match(es) dropped while rate limited")
+            rule.dropped = 0
+        print(f"[{now_str()}] Rule {rule.name}: sending {len(batch)} match(es)")
+        req = build_request(rule, batch)
+        if req is None:
+            continue
+        if not client.post(req["url"], req["body"].encode("utf-8"), req["content_type"]):
+            queue.push(req)
+
+# ——— Main loop ————————————————————————————————————————————————
+
+def read_config(path: str = SETTINGS_FILE) -> Optional[dict]:
+    if not os.path.exists(path):
+        return {}
+    data = load_json(path)
+    if not data:
+        return None     # invalid JSON: keep previous settings
+    cfg = data.get("config", {})
+    return cfg if isinstance(cfg, dict) else {}
+
+def run(log_path: str = LOG_PATH, settings_path: str = SETTINGS_FILE, queue: Optional[RetryQueue] = None) -> None:
+    follower = LogFollower(log_path)
+    follower.seek_end()    # never alert on historical entries
+    client = HttpClient()
+    queue = queue or RetryQueue()
+    engine = AlertEngine({})
+    settings_mtime = None
+    high_water = None      # newest line time seen, to skip lines re-read after truncation
+    seen: set = set()      # hashes of the last SEEN_MAX lines, for the same purpose
+    seen_order: deque = deque()
+    next_retry = 0.0
+
+    while not terminate:
+        now = time.monotonic()
+
+        # 1) Reload settings on change
+        try:
+            mtime = os.stat(settings_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != settings_mtime:
+            cfg = read_config(settings_path)
+            if cfg is None:
+                print(f"[WARN ] Invalid JSON in {settings_path}; using previous settings", file=sys.stderr)
+            else:
+                engine = AlertEngine(cfg)
+                state = "ON" if engine.enabled else "OFF"
+                print(f"[{now_str()}] Monitoring {state}; {len(engine.rules)} rule(s), {len(engine.matcher.patterns)} string(s)")
+            settings_mtime = mtime
+
+        # 2) Read new lines. After a truncation or rewrite the follower starts
+        #    over; lines already seen (recent ones by content, older ones by
+        #    time) are skipped until the first new line.
+        reset = follower.sync()
+        for _, raw in follower.read_lines():
+            line = decode_line(raw).rstrip("\r\n")
+            key = hash(line)
+            obj = None
+            if line.startswith("{"):
+                try:
+                    obj = json.loads(line)
+                except (json.JSONDecodeError, ValueError):
+                    obj = None
+            if not isinstance(obj, dict):
+                obj = {}
+            ts = parse_time(obj.get("local_time_adjusted")) or parse_time(obj.get("local_time"))
+            if reset:
+                if key in seen or (ts is not None and high_water is not None and ts <= high_water):
+                    continue
+                reset = False
+            seen_order.append(key)
+            seen.add(key)
+            if len(seen_order) > SEEN_MAX:
+                seen.discard(seen_order.popleft())
+            if ts is not None and (high_water is None or ts > high_water):
+                high_water = ts
+            if engine.enabled:
+                engine.feed(line, now, obj)
+
+        # 3) Deliver due batches
+        deliver(engine.due(now), client, queue)
+
+        # 4) Retry failed deliveries
+        if now >= next_retry:
+            queue.flush(client)
+            next_retry = now + RETRY_INTERVAL
+
+        time.sleep(POLL_INTERVAL)
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    try:
+        run()
+    except Exception as e:
+        print(f"[!] Unhandled exception: {e}")
@@ -0,0 +1,302 @@
+import os
+import io
+import re
+import json
+import shutil
+import hashlib
+import zipfile
+import datetime
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils import BACKUP_DIR, CONFIG_PATH, SKIN_DIR
+
+# ——— Layout ——————————————————————————————————————————————————————
+#
+# A backup is still a backup-<ts>.zip holding app/ and config/ files, but its
+# skins are not stored inline: "manifest.json" maps each skins/<rel> member
+# to a content hash, and the bytes live once in BLOB_DIR/<hash[:2]>/<hash>.
+# Unchanged skin files therefore cost nothing in later backups. Downloads
+# expand the references into a self-contained zip; restores accept both
+# forms (uploaded and older backups carry skins/ members inline).
+
+BLOB_DIR       = os.path.join(BACKUP_DIR, "blobs")
+SKIN_CACHE_DIR = "/var/tmp/opencanary-skin-zips"
+APP_DIR_TARGET_FILES = {"settings.conf", "rsyslog-opencanary.conf"}
+MANIFEST       = "manifest.json"
+CHUNK          = 1024 * 1024
+
+# ——— Content hashes ——————————————————————————————————————————————
+
+_hash_memo: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+_hash_lock = threading.Lock()
+
+def file_digest(path: str) -> str:
+    """
+    blake2b of a file's content, memoised on (inode, size, mtime) so
+    unchanged files are never read twice by this process.
+    """
+    st = os.stat(path)
+    key = (st.st_ino, st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        memo = _hash_memo.get(path)
+    if memo is not None and memo[0] == key:
+        return memo[1]
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hash_memo[path] = (key, digest)
+    return digest
+
+def walk_files(root: str) -> Iterator[Tuple[str, str]]:
+    """
+    (full path, path relative to root) for every file under root, sorted.
+    """
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for f in sorted(files):
+            full = os.path.join(dirpath, f)
+            yield full, os.path.relpath(full, root)
+
+def tree_digest(root: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    for full, rel in walk_files(root):
+        h.update(rel.encode("utf-8", "surrogateescape") + b"\0" + file_digest(full).encode() + b"\n")
+    return h.hexdigest()
+
+def copy_stream(src, dest: str) -> None:
+    # Write through a temp file so a failed restore never leaves half a file
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = dest + ".tmp"
+    with open(tmp, "wb") as out:
+        shutil.copyfileobj(src, out, CHUNK)
+    os.replace(tmp, dest)
+
+def safe_join(root: str, rel: str) -> Optional[str]:
+    dest = os.path.normpath(os.path.join(root, rel))
+    if not dest.startswith(os.path.normpath(root) + os.sep):
+        return None
+    return dest
+
+# ——— Skin archives ———————————————————————————————————————————————
+
+def list_skins() -> List[str]:
+    try:
+        return sorted(d for d in os.listdir(SKIN_DIR) if os.path.isdir(os.path.join(SKIN_DIR, d)))
+    except FileNotFoundError:
+        return []
+
+def skin_zip(name: str) -> bytes:
+    """
+    Zip of one skin, rebuilt only when its content hash changes.
+    """
+    src = os.path.join(SKIN_DIR, name)
+    digest = tree_digest(src)
+    os.makedirs(SKIN_CACHE_DIR, exist_ok=True)
+    cached = os.path.join(SKIN_CACHE_DIR, f"{name}-{digest}.zip")
+    if not os.path.exists(cached):
+        tmp = cached + f".{threading.get_ident()}.tmp"
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for full, rel in walk_files(src):
+                zf.write(full, rel)
+        os.replace(tmp, cached)
+        stale = re.compile(re.escape(name) + r"-[0-9a-f]{40}\.zip")
+        for old in os.listdir(SKIN_CACHE_DIR):
+            if stale.fullmatch(old) and old != os.path.basename(cached):
+                os.remove(os.path.join(SKIN_CACHE_DIR, old))
+    with open(cached, "rb") as f:
+        return f.read()
+
+# ——— Backups —————————————————————————————————————————————————————
+
+def blob_path(digest: str) -> str:
+    return os.path.join(BLOB_DIR, digest[:2], digest)
+
+def store_blob(full: str, digest: str) -> bool:
+    """
+    Copy a file into the blob store unless already there; True if written.
+    """
+    dest = blob_path(digest)
+    if os.path.exists(dest):
+        return False
+    with open(full, "rb") as src:
+        copy_stream(src, dest)
+    return True
+
+def read_manifest(zf: zipfile.ZipFile) -> Dict[str, str]:
+    try:
+        return json.loads(zf.read(MANIFEST))
+    except (KeyError, ValueError):
+        return {}
+
+def list_backups() -> List[str]:
+    return sorted((f for f in os.listdir(BACKUP_DIR) if f.endswith(".zip")), reverse=True)
+
+def create_backup(path: str, progress=None) -> dict:
+    """
+    Write a backup zip to `path`. `progress(done, total)` is called as
+    files are processed. Returns counts of skin files stored vs reused.
+    """
+    app_files = []
+    for root, dirs, files in os.walk("/app"):
+        if BACKUP_DIR in root:
+            continue
+        dirs[:] = [d for d in dirs if d not in ("__pycache__",) and not d.startswith(".")]
+        for f in files:
+            if f.startswith(".") or f not in APP_DIR_TARGET_FILES:
+                continue
+            full = os.path.join(root, f)
+            app_files.append((full, os.path.join("app", os.path.relpath(full, "/app"))))
+    skins = list(walk_files(SKIN_DIR)) if os.path.isdir(SKIN_DIR) else []
+    total = len(app_files) + 1 + len(skins)
+    done = 0
+    stats = {"stored": 0, "reused": 0}
+
+    tmp = path + ".tmp"
+    manifest = {}
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # app/ files and the OpenCanary config are small: keep them inline
+        for full, arc in app_files + [(CONFIG_PATH, os.path.join("config", os.path.basename(CONFIG_PATH)))]:
+            zf.write(full, arc)
+            done += 1
+            if progress:
+                progress(done, total)
+
+        # skins/ by reference into the shared blob store
+        for full, rel in skins:
+            digest = file_digest(full)
+            stats["stored" if store_blob(full, digest) else "reused"] += 1
+            manifest[os.path.join("skins", rel)] = digest
+            done += 1
+            if progress:
+                progress(done, total)
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=None))
+    os.replace(tmp, path)
+    return stats
+
+def export_backup(path: str) -> bytes:
+    """
+    Self-contained copy of a backup with skin blobs expanded inline.
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as out:
+        manifest = read_manifest(src)
+        for info in src.infolist():
+            if info.filename == MANIFEST:
+                continue
+            with src.open(info) as m, out.open(info.filename, "w") as o:
+                shutil.copyfileobj(m, o, CHUNK)
+        for arc, digest in manifest.items():
+            out.write(blob_path(digest), arc)
+    return buf.getvalue()
+
+def restore_target(member: str) -> Optional[str]:
+    if member.startswith("config/"):
+        return CONFIG_PATH
+    if member.startswith("skins/"):
+        return safe_join(SKIN_DIR, member[len("skins/"):])
+    if member.startswith("app/"):
+        return safe_join("/app", member[len("app/"):])
+    return None
+
+def restore_backup(path: str) -> None:
+    """
+    Restore a backup, streaming members (and referenced blobs) to disk.
+    Raises FileNotFoundError, before anything is written, if a blob the
+    backup refers to is not in the blob store.
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        manifest = read_manifest(zf)
+        missing = [member for member, digest in manifest.items()
+                   if restore_target(member) is not None and not os.path.exists(blob_path(digest))]
+        if missing:
+            raise FileNotFoundError(
+                f"{len(missing)} skin file(s) missing from the blob store, e.g. {missing[0]}")
+        for info in zf.infolist():
+            if info.is_dir() or info.filename.startswith("backups/") or info.filename == MANIFEST:
+                continue
+            dest = restore_target(info.filename)
+            if dest is None:
+                continue
+            with zf.open(info) as src:
+                copy_stream(src, dest)
+        for member, digest in manifest.items():
+            dest = restore_target(member)
+            if dest is None:
+                continue
+            with open(blob_path(digest), "rb") as src:
+                copy_stream(src, dest)
+
+def prune_blobs() -> int:
+    """
+    Delete blobs no remaining backup refers to; returns how many.
+    """
+    if job_running():
+        return 0
+    live = set()
+    for name in list_backups():
+        try:
+            with zipfile.ZipFile(os.path.join(BACKUP_DIR, name)) as zf:
+                live.update(read_manifest(zf).values())
+        except (zipfile.BadZipFile, OSError):
+            continue
+    removed = 0
+    for full, rel in list(walk_files(BLOB_DIR)) if os.path.isdir(BLOB_DIR) else []:
+        if os.path.basename(rel) not in live:
+            os.remove(full)
+            removed += 1
+    return removed
+
+# ——— Background worker ———————————————————————————————————————————
+
+class BackupJob:
+    """
+    One backup running in a daemon thread; the UI polls `done`/`total`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = os.path.join(BACKUP_DIR, name)
+        self.done = 0
+        self.total = 0
+        self.stats: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.finished = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _progress(self, done: int, total: int) -> None:
+        self.done, self.total = done, total
+
+    def _run(self) -> None:
+        try:
+            self.stats = create_backup(self.path, self._progress)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.finished = True
+
+_job: Optional[BackupJob] = None
+_job_lock = threading.Lock()
+
+def start_backup() -> BackupJob:
+    """
+    Start a backup in the background, or return the one already running.
+    """
+    global _job
+    with _job_lock:
+        if _job is None or _job.finished:
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            ts = datetime.datetime.now().strftime("%Y%m%d-%H%M")
+            _job = BackupJob(f"backup-{ts}.zip")
+            _job._thread.start()
+        return _job
+
+def current_job() -> Optional[BackupJob]:
+    return _job
+
+def job_running() -> bool:
+    job = _job
+    return job is not None and not job.finished
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# python3 -m bench run --lines 1000000 --output results.json
+# python3 -m bench compare old.json new.json
+# python3 -m bench gen-log /tmp/opencanary.log --lines 100000
+# python3 -m bench gen-trace /tmp/trace.txt --lines 100000
+# python3 -m bench senders --target 127.0.0.1:5140 --nodes 8 --events 50000 --proto udp
+#
+# Run from the app directory (/opt/streamlit) so the app modules import.
+#
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+from .loggen import DEFAULT_MIX, generate_log, generate_trace
+from .suites import CASES, select
+from .runner import run_cases, compare, load_report
+from .senders import SenderPool
+
+def add_log_args(p):
+    p.add_argument("--lines", type=int, default=100000, help="log lines to generate (10k to 10M)")
+    p.add_argument("--mix", default=DEFAULT_MIX, help="logtype:weight,... (default %(default)s)")
+    p.add_argument("--span", default="7d", help="time spread of the log, e.g. 6h, 7d, 90d")
+    p.add_argument("--hosts", type=int, default=500, help="distinct source hosts")
+    p.add_argument("--malformed", type=float, default=0.001, help="fraction of malformed lines")
+    p.add_argument("--seed", type=int, default=1)
+
+def add_trace_args(p, flag=""):
+    p.add_argument(f"--{flag}lines", dest="trace_lines" if flag else "lines", type=int, default=100000,
+                   help="tcpdump lines to generate")
+    p.add_argument("--sources", type=int, default=200, help="distinct scanning hosts")
+    p.add_argument("--udp", type=float, default=0.2, help="fraction of UDP datagrams")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python3 -m bench", description="OpenCanary UI benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="generate inputs and run benchmark cases")
+    add_log_args(p_run)
+    add_trace_args(p_run, flag="trace-")
+    p_run.add_argument("--only", help="comma-separated case name prefixes (e.g. dashboard,portscan)")
+    p_run.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    p_run.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    p_run.add_argument("--label", help="free-form label stored in the report (e.g. a version)")
+    p_run.add_argument("--output", "-o", help="write the JSON report here instead of stdout")
+    p_run.add_argument("--workdir", help="directory for generated inputs (default: a temp dir)")
+    p_run.add_argument("--keep", action="store_true", help="keep the work directory")
+    p_run.add_argument("--list", action="store_true", help="list case names and exit")
+
+    p_cmp = sub.add_parser("compare", help="compare two JSON reports")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=1.10, help="ratio counted as a regression")
+
+    p_log = sub.add_parser("gen-log", help="write a synthetic OpenCanary log")
+    p_log.add_argument("path")
+    add_log_args(p_log)
+
+    p_trace = sub.add_parser("gen-trace", help="write a synthetic tcpdump text trace")
+    p_trace.add_argument("path")
+    add_trace_args(p_trace)
+    p_trace.add_argument("--seed", type=int, default=1)
+
+    p_send = sub.add_parser("senders", help="point simulated canaries at a running aggregator")
+    p_send.add_argument("--target", default="127.0.0.1:5140", help="aggregator host:port")
+    p_send.add_argument("--nodes", type=int, default=4, help="simulated canary nodes")
+    p_send.add_argument("--events", type=int, default=10000, help="events per node")
+    p_send.add_argument("--proto", choices=["udp", "tcp"], default="udp")
+    p_send.add_argument("--rate", type=float, default=0.0, help="events/sec per node (0 = unthrottled)")
+    p_send.add_argument("--syslog", action="store_true", help="prefix each event with a syslog header")
+    p_send.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "senders":
+        host, _, port = args.target.rpartition(":")
+        pool = SenderPool(args.nodes, args.events, args.proto, args.rate, args.syslog, args.seed, host or "127.0.0.1")
+        pool.wait_ready()
+        pool.go(int(port))
+        results = pool.wait()
+        sent = sum(r["sent"] for r in results)
+        seconds = max(r["seconds"] for r in results)
+        print(json.dumps({"nodes": results, "sent": sent, "seconds": seconds,
+                          "events_per_sec": sent / max(seconds, 1e-9)}))
+        return 0
+
+    if args.cmd == "gen-log":
+        meta = generate_log(args.path, args.lines, args.mix, args.span, args.hosts, args.malformed, args.seed)
+        print(json.dumps(meta))
+        return 0
+
+    if args.cmd == "gen-trace":
+        meta = generate_trace(args.path, args.lines, sources=args.sources, udp=args.udp, seed=args.seed)
+        print(json.dumps(meta))
+        return 0
+
+    if args.cmd == "compare":
+        rows = compare(load_report(args.old), load_report(args.new), args.threshold)
+        for row in rows:
+            mark = "REGRESSED" if row["regressed"] else ""
+            alloc = f"  alloc x{row['alloc_ratio']:.2f}" if "alloc_ratio" in row else ""
+            print(f"{row['name']:30} {row['old']:9.4f}s -> {row['new']:9.4f}s  x{row['time_ratio']:.2f}{alloc}  {mark}")
+        return 1 if any(r["regressed"] for r in rows) else 0
+
+    cases = select(args.only)
+    if args.list:
+        print("\n".join(c.name for c in CASES))
+        return 0
+    if not cases:
+        print(f"No cases match {args.only!r}", file=sys.stderr)
+        return 2
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="oc-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        ctx = {"workdir": workdir, "log": os.path.join(workdir, "opencanary.log"),
+               "trace": os.path.join(workdir, "tcpdump.txt")}
+        print(f"[bench] generating {args.lines} log lines and {args.trace_lines} trace lines in {workdir}",
+              file=sys.stderr)
+        ctx["log_meta"] = generate_log(ctx["log"], args.lines, args.mix, args.span, args.hosts,
+                                       args.malformed, args.seed)
+        ctx["trace_meta"] = generate_trace(ctx["trace"], args.trace_lines, sources=args.sources,
+                                           udp=args.udp, seed=args.seed)
+        report = run_cases(cases, ctx, args.repeat, not args.no_memory, args.label)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+    return 1 if any("error" in r for r in report["results"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
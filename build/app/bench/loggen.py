@@ -0,0 +1,177 @@
+import random
+import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# ——— Synthetic OpenCanary logs ———————————————————————————————————
+#
+# Lines look like what opencanaryd writes to /var/tmp/opencanary.log: one
+# JSON object per line, oldest first. Everything is driven by one seeded
+# Random, so the same arguments always give the same events (timestamps are
+# relative to `end`, which defaults to now).
+
+# logtype -> (dst_port, logdata JSON); None port means "pick a scanned port"
+LOGTYPES: Dict[int, Tuple[Optional[int], str]] = {
+    1001: (-1, '{"msg": {"logdata": "Canary running!!!"}}'),
+    2000: (21, '{"USERNAME": "admin", "PASSWORD": "admin123"}'),
+    3000: (80, '{"HOSTNAME": "10.0.0.5", "PATH": "/index.html", "USERAGENT": "Mozilla/5.0"}'),
+    3001: (80, '{"HOSTNAME": "10.0.0.5", "PATH": "/index.html", "USERNAME": "root", "PASSWORD": "toor", "USERAGENT": "curl/8.5.0"}'),
+    4000: (22, '{"LOCALVERSION": "SSH-2.0-OpenSSH_5.1p1 Debian-4", "REMOTEVERSION": "SSH-2.0-libssh2_1.4.3"}'),
+    4002: (22, '{"LOCALVERSION": "SSH-2.0-OpenSSH_5.1p1 Debian-4", "PASSWORD": "123456", "REMOTEVERSION": "SSH-2.0-Go", "USERNAME": "root"}'),
+    5001: (None, '{"FIN": "", "ID": "54321", "IN": "eth0", "LEN": "60", "SYN": "", "TTL": "64", "WINDOW": "29200"}'),
+    6001: (23, '{"PASSWORD": "password", "USERNAME": "admin"}'),
+    8001: (3306, '{"PASSWORD": "b4e2", "USERNAME": "root"}'),
+}
+DEFAULT_MIX = "5001:40,4000:20,4002:10,3000:12,3001:4,2000:4,6001:4,8001:3,1001:1"
+SCAN_PORTS = [21, 22, 23, 25, 53, 80, 110, 139, 143, 443, 445, 1433, 3306, 3389, 5432, 5900, 6379, 8080, 8443]
+NODE_IDS = ["opencanary-1", "opencanary-2", "dmz-canary"]
+NODE_WEIGHTS = [6, 3, 1]
+DST_HOST = "10.0.0.5"
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def parse_mix(spec: str) -> Tuple[List[int], List[float]]:
+    """
+    "5001:40,4000:20" -> ([5001, 4000], [40.0, 20.0])
+    """
+    types, weights = [], []
+    for part in spec.split(","):
+        lt, _, w = part.strip().partition(":")
+        types.append(int(lt))
+        weights.append(float(w or 1))
+    return types, weights
+
+def parse_span(spec: str) -> float:
+    """
+    "90m" / "36h" / "7d" / plain seconds -> seconds.
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if spec and spec[-1] in units:
+        return float(spec[:-1]) * units[spec[-1]]
+    return float(spec)
+
+def source_hosts(rng: random.Random, count: int) -> Tuple[List[str], List[float]]:
+    """
+    A pool of source IPs (a quarter RFC1918) with Zipf-like weights: a few
+    noisy scanners, a long tail of one-off visitors.
+    """
+    hosts = []
+    for i in range(count):
+        if i % 4 == 0:
+            hosts.append(f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}")
+        else:
+            hosts.append(f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}")
+    return hosts, [1.0 / (k + 1) for k in range(count)]
+
+def malformed_line(rng: random.Random, good: str) -> str:
+    kind = rng.randrange(3)
+    if kind == 0:
+        return good[: rng.randrange(1, len(good) - 1)]      # truncated write
+    if kind == 1:
+        return "Traceback (most recent call last): twisted.internet.error.ConnectionLost"
+    return '"not an object"'
+
+def iter_log_lines(lines: int, mix: str = DEFAULT_MIX, span: str = "7d", hosts: int = 500,
+                   malformed: float = 0.001, seed: int = 1, end: Optional[datetime.datetime] = None,
+                   node_ids: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    Yield `lines` OpenCanary JSON lines (with "\n") spread evenly over
+    `span` up to `end`, drawn from `node_ids` (default NODE_IDS, skewed).
+    """
+    rng = random.Random(seed)
+    end = end or datetime.datetime.now().replace(microsecond=0)
+    seconds = parse_span(span)
+    start = end - datetime.timedelta(seconds=seconds)
+    step = seconds / max(lines, 1)
+    types, weights = parse_mix(mix)
+    pool, pool_weights = source_hosts(rng, hosts)
+    node_pool, node_weights = (node_ids, None) if node_ids else (NODE_IDS, NODE_WEIGHTS)
+
+    # Draw in chunks: random.choices is much cheaper per call for many k
+    chunk = 10000
+    for base in range(0, lines, chunk):
+        n = min(chunk, lines - base)
+        lts = rng.choices(types, weights, k=n)
+        srcs = rng.choices(pool, pool_weights, k=n)
+        nodes = rng.choices(node_pool, node_weights, k=n)
+        for i in range(n):
+            ts = start + datetime.timedelta(seconds=(base + i + rng.random()) * step)
+            local = ts.strftime(TS_FORMAT)
+            utc = ts.astimezone(datetime.timezone.utc).strftime(TS_FORMAT)
+            lt = lts[i]
+            port, logdata = LOGTYPES.get(lt, (rng.choice(SCAN_PORTS), "{}"))
+            if port is None:
+                port = rng.choice(SCAN_PORTS)
+            line = (
+                f'{{"dst_host": "{DST_HOST}", "dst_port": {port}, "local_time": "{local}", '
+                f'"local_time_adjusted": "{local}", "logdata": {logdata}, "logtype": {lt}, '
+                f'"node_id": "{nodes[i]}", "src_host": "{srcs[i]}", '
+                f'"src_port": {rng.randrange(1024, 65536)}, "utc_time": "{utc}"}}'
+            )
+            if malformed and rng.random() < malformed:
+                line = malformed_line(rng, line)
+            yield line + "\n"
+
+def generate_log(path: str, lines: int, mix: str = DEFAULT_MIX, span: str = "7d",
+                 hosts: int = 500, malformed: float = 0.001, seed: int = 1,
+                 end: Optional[datetime.datetime] = None) -> dict:
+    """
+    Write a synthetic log (see iter_log_lines). Returns the parameters and
+    byte size, for the benchmark report.
+    """
+    end = end or datetime.datetime.now().replace(microsecond=0)
+    size = 0
+    buf = []
+    with open(path, "w", encoding="utf-8") as f:
+        for line in iter_log_lines(lines, mix, span, hosts, malformed, seed, end):
+            buf.append(line)
+            if len(buf) >= 10000:
+                data = "".join(buf)
+                f.write(data)
+                size += len(data)
+                buf = []
+        data = "".join(buf)
+        f.write(data)
+        size += len(data)
+    return {"path": path, "lines": lines, "bytes": size, "mix": mix, "span": span,
+            "hosts": hosts, "malformed": malformed, "seed": seed, "end": end.isoformat()}
+
+# ——— Synthetic tcpdump traces ———————————————————————————————————
+
+def generate_trace(path: str, lines: int, host_ip: str = DST_HOST, sources: int = 200,
+                   udp: float = 0.2, noise: float = 0.05, seed: int = 1) -> dict:
+    """
+    Write `tcpdump -nnl -tt` text as portscanmod.py reads it: SYNs and UDP
+    datagrams to host_ip from a pool of scanners sweeping ports, plus a
+    fraction of lines the parser must skip (ARP, bare ACKs).
+    """
+    rng = random.Random(seed)
+    pool, pool_weights = source_hosts(rng, sources)
+    t = 1700000000.0
+    size = 0
+    with open(path, "w", encoding="utf-8") as f:
+        buf = []
+        for i in range(lines):
+            t += rng.expovariate(2000.0)
+            src = rng.choices(pool, pool_weights)[0]
+            sport = rng.randrange(1024, 65536)
+            dport = rng.randrange(1, 65536) if rng.random() < 0.5 else rng.choice(SCAN_PORTS)
+            r = rng.random()
+            if r < noise / 2:
+                line = f"{t:.6f} ARP, Request who-has {host_ip} tell {src}, length 46"
+            elif r < noise:
+                line = f"{t:.6f} IP {src}.{sport} > {host_ip}.{dport}: Flags [.], ack 1, win 502, length 0"
+            elif r < noise + udp:
+                line = f"{t:.6f} IP {src}.{sport} > {host_ip}.{dport}: UDP, length {rng.randrange(0, 512)}"
+            else:
+                line = (f"{t:.6f} IP {src}.{sport} > {host_ip}.{dport}: Flags [S], seq {rng.getrandbits(32)}, "
+                        f"win 1024, options [mss 1460], length 0")
+            buf.append(line + "\n")
+            if len(buf) >= 10000:
+                data = "".join(buf)
+                f.write(data)
+                size += len(data)
+                buf = []
+        data = "".join(buf)
+        f.write(data)
+        size += len(data)
+    return {"path": path, "lines": lines, "bytes": size, "host_ip": host_ip,
+            "sources": sources, "udp": udp, "noise": noise, "seed": seed}
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import statistics
+import traceback
+import tracemalloc
+import multiprocessing
+from typing import List, Optional
+
+from .suites import Case
+
+# ——— Measurement —————————————————————————————————————————————————
+#
+# Every repetition runs in a forked child so one case's caches, lru_caches
+# and heap growth never leak into the next. Timed runs report wall time and
+# the child's peak RSS (which includes setup); one extra run under
+# tracemalloc reports the peak Python allocation of run() alone.
+
+def _child(case: Case, ctx: dict, trace: bool, conn) -> None:
+    # Progress chatter from the code under test would corrupt a report on stdout
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    sys.stdout = open(1, "w", closefd=False)
+    try:
+        state = case.setup(ctx)
+        if trace:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        extra = case.run(state)
+        elapsed = time.perf_counter() - start
+        result = {"seconds": elapsed, "extra": extra or {},
+                  "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+        if trace:
+            result["peak_alloc_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        conn.send(result)
+    except Exception:
+        conn.send({"error": traceback.format_exc()})
+    finally:
+        conn.close()
+
+def _once(case: Case, ctx: dict, trace: bool = False) -> dict:
+    mp = multiprocessing.get_context("fork")
+    parent, child = mp.Pipe(duplex=False)
+    proc = mp.Process(target=_child, args=(case, ctx, trace, child))
+    proc.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {"error": f"benchmark process died (exit code {proc.exitcode})"}
+    proc.join()
+    if proc.exitcode not in (0, None) and "error" not in result:
+        result["error"] = f"exit code {proc.exitcode}"
+    return result
+
+def measure(case: Case, ctx: dict, repeat: int = 3, memory: bool = True) -> dict:
+    runs = [_once(case, ctx) for _ in range(repeat)]
+    errors = [r["error"] for r in runs if "error" in r]
+    if errors:
+        return {"name": case.name, "error": errors[0]}
+    seconds = [r["seconds"] for r in runs]
+    out = {
+        "name": case.name,
+        "runs": len(runs),
+        "seconds": seconds,
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+        "peak_rss_kib": max(r["peak_rss_kib"] for r in runs),
+        "extra": runs[-1]["extra"],
+    }
+    if memory:
+        traced = _once(case, ctx, trace=True)
+        if "error" in traced:
+            out["error"] = traced["error"]
+        else:
+            out["peak_alloc_kib"] = traced["peak_alloc_kib"]
+    return out
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def run_cases(cases: List[Case], ctx: dict, repeat: int = 3, memory: bool = True,
+              label: Optional[str] = None, log=sys.stderr) -> dict:
+    results = []
+    for case in cases:
+        print(f"[bench] {case.name} ...", file=log, flush=True)
+        r = measure(case, ctx, repeat, memory)
+        if "error" in r:
+            print(f"[bench] {case.name} failed:\n{r['error']}", file=log)
+        else:
+            print(f"[bench] {case.name}: median {r['median']:.4f}s, "
+                  f"peak RSS {r['peak_rss_kib'] // 1024} MiB", file=log)
+        results.append(r)
+    return {
+        "label": label,
+        "environment": environment(),
+        "inputs": {k: v for k, v in ctx.items() if k.endswith("_meta")},
+        "repeat": repeat,
+        "results": results,
+    }
+
+# ——— Comparison ——————————————————————————————————————————————————
+
+def compare(old: dict, new: dict, threshold: float = 1.10) -> List[dict]:
+    """
+    Per-case ratios new/old of median time and peak allocation; a case is
+    flagged when either grows by more than `threshold`.
+    """
+    before = {r["name"]: r for r in old.get("results", []) if "error" not in r}
+    rows = []
+    for r in new.get("results", []):
+        o = before.get(r["name"])
+        if o is None or "error" in r:
+            continue
+        row = {"name": r["name"], "old": o["median"], "new": r["median"],
+               "time_ratio": r["median"] / max(o["median"], 1e-9)}
+        if o.get("peak_alloc_kib") and "peak_alloc_kib" in r:
+            row["alloc_ratio"] = r["peak_alloc_kib"] / o["peak_alloc_kib"]
+        row["regressed"] = any(
+            v > threshold for v in (row["time_ratio"], row.get("alloc_ratio", 0.0))
+        )
+        rows.append(row)
+    return rows
+
+def load_report(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,98 @@
+import time
+import socket
+import multiprocessing
+from typing import List, Optional
+
+from .loggen import iter_log_lines
+
+# ——— Simulated canaries ——————————————————————————————————————————
+#
+# Each sender is a forked process playing one canary node: it renders its
+# events up front, waits for the go signal (the target port), then sends
+# them to the aggregator as fast as allowed. UDP sends one event per
+# datagram like OpenCanary's SysLogHandler; TCP streams newline-delimited
+# lines like rsyslog's omfwd.
+
+SYSLOG_PREFIX = "<134>{ts} {node} opencanaryd[1]: "
+
+def render(node: str, events: int, syslog: bool, span: str = "1h", seed: int = 1,
+           malformed: float = 0.0) -> List[bytes]:
+    out = []
+    for line in iter_log_lines(events, span=span, seed=seed, malformed=malformed, node_ids=[node]):
+        if syslog:
+            line = SYSLOG_PREFIX.format(ts=time.strftime("%b %e %H:%M:%S"), node=node) + line
+        out.append(line.encode("utf-8"))
+    return out
+
+def send(host: str, port: int, proto: str, lines: List[bytes], rate: float = 0.0) -> int:
+    """
+    Send every line; `rate` caps events/sec (0 = unthrottled). Returns count.
+    """
+    start = time.perf_counter()
+    sent = 0
+    step = 1000
+    if proto == "tcp":
+        with socket.create_connection((host, port)) as s:
+            for i in range(0, len(lines), step):
+                s.sendall(b"".join(lines[i:i + step]))
+                sent += len(lines[i:i + step])
+                if rate:
+                    ahead = sent / rate - (time.perf_counter() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+    else:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for line in lines:
+                s.sendto(line, (host, port))
+                sent += 1
+                if rate and sent % step == 0:
+                    ahead = sent / rate - (time.perf_counter() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+    return sent
+
+def _sender(node, events, proto, rate, syslog, seed, host, ports, ready, results) -> None:
+    lines = render(node, events, syslog, seed=seed)
+    ready.put(node)
+    port = ports.get()
+    start = time.perf_counter()
+    sent = send(host, port, proto, lines, rate)
+    results.put({"node": node, "sent": sent, "seconds": time.perf_counter() - start})
+
+class SenderPool:
+    """
+    Fork the senders first (before the caller starts any threads), let them
+    render with wait_ready(), release them with go(port) and collect their
+    results with wait().
+    """
+
+    def __init__(self, nodes: int, events: int, proto: str = "udp", rate: float = 0.0,
+                 syslog: bool = False, seed: int = 1, host: str = "127.0.0.1"):
+        mp = multiprocessing.get_context("fork")
+        self.ports = mp.Queue()
+        self.ready = mp.Queue()
+        self.results = mp.Queue()
+        self.total = nodes * events
+        self.procs = []
+        for k in range(nodes):
+            p = mp.Process(
+                target=_sender,
+                args=(f"sim-canary-{k + 1}", events, proto, rate, syslog, seed + k, host, self.ports, self.ready, self.results),
+                daemon=True,
+            )
+            p.start()
+            self.procs.append(p)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> None:
+        for _ in self.procs:
+            self.ready.get(timeout=timeout)
+
+    def go(self, port: int) -> None:
+        for _ in self.procs:
+            self.ports.put(port)
+
+    def wait(self, timeout: Optional[float] = None) -> List[dict]:
+        out = [self.results.get(timeout=timeout) for _ in self.procs]
+        for p in self.procs:
+            p.join()
+        return out
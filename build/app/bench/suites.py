@@ -0,0 +1,326 @@
+import os
+import time
+import shutil
+import asyncio
+import datetime
+import threading
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+import utils
+import rollup
+import logquery
+from logstore import LogCache, decode_line
+from rollup import CHART_WINDOWS, RollupStore
+from logquery import LogIndex
+import retention
+import alerting
+import portscanmod
+import aggregator
+
+from .loggen import DST_HOST, parse_span
+from .senders import SenderPool
+
+# ——— Cases ———————————————————————————————————————————————————————
+#
+# setup(ctx) runs untimed and returns the state run(state) works on; run may
+# return a dict of extra numbers for the report. Each repetition gets a fresh
+# process (see runner.py), so setup is free to mutate module globals or
+# consume files in the work directory.
+
+class Case(NamedTuple):
+    name: str
+    setup: Callable[[dict], object]
+    run: Callable[[object], Optional[dict]]
+
+DEFAULT_FILTER = "-888 -1001"
+INDEX_FILTERS = ["src_host:10.0.0.0/8", "dst_port:22 -4000", "root", "since:1d logtype:4002"]
+RERUNS = 20
+SETTINGS_CALLS = 10000
+AGG_NODES = 4
+AGG_TIMEOUT = 600
+CUTOFF_PROBES = 100
+
+def _work(ctx: dict, name: str) -> str:
+    path = os.path.join(ctx["workdir"], name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+def _log_end(ctx: dict) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(ctx["log_meta"]["end"])
+
+def _log_span(ctx: dict) -> float:
+    return parse_span(ctx["log_meta"]["span"])
+
+def _iter_lines(path: str) -> Iterator[str]:
+    # Streamed inside run: holding a 10M-line input in a list would dominate peak RSS
+    with open(path, "rb") as f:
+        for raw in f:
+            yield decode_line(raw).rstrip("\r\n")
+
+# ——— Dashboard: parse / filter / bucket ——————————————————————————
+
+def _dashboard_state(ctx: dict, warm: bool):
+    work = _work(ctx, "dashboard")
+    cache = LogCache(ctx["log"])
+    rollups = RollupStore(os.path.join(work, "rollups.json"))
+    rollups.attach(cache)
+    index = LogIndex(os.path.join(work, "index.db"))
+    index.attach(cache)
+    if warm:
+        cache.refresh()
+    return cache, rollups, index
+
+def dashboard_parse_setup(ctx):
+    return LogCache(ctx["log"])
+
+def dashboard_parse(cache):
+    return {"events": len(cache.refresh())}
+
+def dashboard_ingest_setup(ctx):
+    return _dashboard_state(ctx, warm=False)
+
+def dashboard_ingest(state):
+    # First render after start: parse the whole log into rollups and the index
+    cache, rollups, index = state
+    new = cache.refresh()
+    return {"events": len(new)}
+
+DASHBOARD_PAGE = "from dashboard import render_dashboard\nrender_dashboard()\n"
+
+def _page_run(page) -> None:
+    page.run()
+    if page.exception:
+        raise RuntimeError(page.exception[0].message)
+
+def dashboard_rerun_setup(ctx):
+    # dashboard.render_dashboard itself, run headless by Streamlit's AppTest in
+    # this (forked) process, over an index and rollups built as indexer.py does
+    from streamlit.testing.v1 import AppTest
+    cache, rollups, index = _dashboard_state(ctx, warm=True)
+    rollups.save()
+    rollup.ROLLUP_FILE = rollups.path
+    logquery.INDEX_FILE = index.path
+    page = AppTest.from_string(DASHBOARD_PAGE, default_timeout=AGG_TIMEOUT)
+    _page_run(page)         # first render: imports, first log page
+    return page
+
+def dashboard_rerun(page):
+    # What a user's clicks cost once the data is warm: each filter change
+    # (chart from rollups, or the index for filters rollups can't express,
+    # plus a new first page), each chart window change, and "Show more"
+    filters = [DEFAULT_FILTER] + INDEX_FILTERS
+    windows = list(CHART_WINDOWS)
+    reruns = 0
+    for i in range(RERUNS):
+        page.text_input(key="filter").set_value(filters[(i + 1) % len(filters)])
+        _page_run(page)
+        page.selectbox(key="chart_window").set_value(windows[i % len(windows)])
+        _page_run(page)
+        reruns += 2
+        for _ in range(2):
+            more = [b for b in page.button if b.key == "show_more_logs_button"]
+            if not more:
+                break
+            more[0].click()
+            _page_run(page)
+            reruns += 1
+    return {"reruns": reruns, "log_lines": len(page.session_state["log_entries"])}
+
+# ——— Settings ————————————————————————————————————————————————————
+
+def settings_setup(ctx):
+    work = _work(ctx, "settings")
+    path = os.path.join(work, "settings.conf")
+    shutil.copyfile(os.path.join(os.path.dirname(utils.__file__), "settings.conf"), path)
+    utils.SETTINGS_FILE = path
+    return ["logman.log_expiry", "config.alert", "config.alert_strings", "credentials.username", "missing.key"]
+
+def settings_get(keys):
+    for i in range(SETTINGS_CALLS):
+        utils.get_setting(keys[i % len(keys)])
+    for _ in range(SETTINGS_CALLS // 10):
+        utils.load_settings()
+    return {"calls": SETTINGS_CALLS + SETTINGS_CALLS // 10}
+
+# ——— Alerting ————————————————————————————————————————————————————
+
+ALERT_CONFIG = {
+    "alert": True,
+    "alert_strings": ["3001", "curl/", "toor"],
+    "alert_rules": [
+        {"name": "ssh-logins-internal", "logtype": [4002], "src_host": "10.0.0.0/8", "dedup_seconds": 60},
+        {"name": "db-logins", "logtype": 8001, "strings": ["root"], "batch_seconds": 30, "max_per_minute": 2},
+        {"name": "node", "node_id": "dmz-canary", "strings": ["PASSWORD"]},
+    ],
+}
+
+def alerting_setup(ctx):
+    return alerting.AlertEngine(ALERT_CONFIG), ctx["log"]
+
+def alerting_feed(state):
+    engine, path = state
+    now = time.time()
+    queued = 0
+    i = -1
+    for i, line in enumerate(_iter_lines(path)):
+        engine.feed(line, now + i * 0.001)
+        if i % 1000 == 999:
+            for _, batch in engine.due(now + i * 0.001):
+                queued += len(batch)
+    return {"lines": i + 1, "matched": queued + sum(len(r.pending) + r.dropped for r in engine.rules)}
+
+# ——— Retention ———————————————————————————————————————————————————
+
+def _hot_copy(ctx):
+    work = _work(ctx, "retention")
+    hot = os.path.join(work, "opencanary.log")
+    shutil.copyfile(ctx["log"], hot)
+    return work, hot
+
+def find_cutoff_setup(ctx):
+    end, span = _log_end(ctx), _log_span(ctx)
+    cutoffs = [end - datetime.timedelta(seconds=span * (i + 0.5) / CUTOFF_PROBES) for i in range(CUTOFF_PROBES)]
+    return ctx["log"], cutoffs
+
+def find_cutoff(state):
+    path, cutoffs = state
+    for c in cutoffs:
+        retention.find_cutoff(path, c)
+    return {"probes": len(cutoffs)}
+
+def rotate_setup(ctx):
+    work, hot = _hot_copy(ctx)
+    before = _log_end(ctx) - datetime.timedelta(seconds=_log_span(ctx) / 2)
+    return hot, os.path.join(work, "archive"), before
+
+def rotate(state):
+    hot, archive, before = state
+    moved = retention.rotate(hot, archive, before, index_path=None, rollup_path=None)
+    return {"bytes_moved": moved, "segments": len(retention.segment_paths(archive))}
+
+def prune_hot_setup(ctx):
+    work, hot = _hot_copy(ctx)
+    days = _log_span(ctx) / 2 / 86400
+    now = _log_end(ctx)
+    return hot, days, now
+
+def prune_hot(state):
+    hot, days, now = state
+    return {"bytes_dropped": retention.prune_hot(days, hot, now)}
+
+def iter_lines_setup(ctx):
+    hot, archive, before = rotate_setup(ctx)
+    retention.rotate(hot, archive, before, index_path=None, rollup_path=None)
+    # one day straddling the archive/hot boundary
+    return hot, archive, before - datetime.timedelta(hours=12), before + datetime.timedelta(hours=12)
+
+def iter_lines(state):
+    hot, archive, start, end = state
+    n = sum(1 for _ in retention.iter_lines(start, end, hot, archive))
+    return {"lines": n}
+
+# ——— Portscan ————————————————————————————————————————————————————
+
+def portscan_setup(ctx):
+    return ctx["trace"]
+
+def portscan_parse(trace):
+    lines = parsed = 0
+    with open(trace, "r", errors="replace") as f:
+        for line in f:
+            lines += 1
+            if portscanmod.parse_line(line) is not None:
+                parsed += 1
+    return {"lines": lines, "parsed": parsed}
+
+def _pipeline(trace, window):
+    writer = portscanmod.KernLogWriter(os.devnull)
+    coalescer = portscanmod.BurstCoalescer(window) if window > 0 else None
+    pipeline = portscanmod.CapturePipeline(writer, host_ip=DST_HOST, interface="eth0", coalescer=coalescer)
+    with open(trace, "r", errors="replace") as f:
+        for line in f:
+            pipeline.feed(line)
+    pipeline.tick(force=True)
+    return {"packets": pipeline.packets, "written": writer.lines_written}
+
+def portscan_pipeline(trace):
+    return _pipeline(trace, 0)
+
+def portscan_pipeline_coalesce(trace):
+    return _pipeline(trace, 5.0)
+
+# ——— Aggregator ——————————————————————————————————————————————————
+
+def _aggregator_setup(ctx, proto):
+    # Senders fork before the aggregator starts its threads
+    pool = SenderPool(AGG_NODES, max(ctx["log_meta"]["lines"] // AGG_NODES, 1), proto)
+    pool.wait_ready(AGG_TIMEOUT)
+    work = _work(ctx, "aggregator")
+    agg = aggregator.Aggregator(
+        "127.0.0.1", 0 if proto == "udp" else None, 0 if proto == "tcp" else None,
+        store_dir=os.path.join(work, "nodes"), index_path=os.path.join(work, "nodes.db"),
+        rollup_path=os.path.join(work, "rollups.json"), status_path=None, settings_path=None,
+        local_log=None,
+    )
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(agg.start(), loop).result()
+    return agg, pool, proto
+
+def aggregator_ingest(state):
+    # Wall time from release until every event is stored (TCP), or until the
+    # store stops growing (UDP, where the kernel may drop datagrams)
+    agg, pool, proto = state
+    start = time.perf_counter()
+    pool.go(agg.udp_port if proto == "udp" else agg.tcp_port)
+    pool.wait(AGG_TIMEOUT)
+    last, idle = None, time.perf_counter()
+    while agg.stored + agg.malformed + agg.duplicates < pool.total:
+        done = agg.stored + agg.malformed + agg.duplicates
+        # Idle once nothing new arrives and the writer has caught up; one
+        # writer batch can take longer than the idle window on its own
+        if (done, agg.received) != last or done < agg.received:
+            last, idle = (done, agg.received), time.perf_counter()
+        elif time.perf_counter() - idle > 1.0:
+            break
+        if time.perf_counter() - start > AGG_TIMEOUT:
+            break
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    return {"nodes": AGG_NODES, "sent": pool.total, "stored": agg.stored, "dropped": agg.dropped,
+            "lost": pool.total - agg.received - agg.dropped, "events_per_sec": agg.stored / elapsed}
+
+def aggregator_tcp_setup(ctx):
+    return _aggregator_setup(ctx, "tcp")
+
+def aggregator_udp_setup(ctx):
+    return _aggregator_setup(ctx, "udp")
+
+# ——— Registry ————————————————————————————————————————————————————
+
+CASES: List[Case] = [
+    Case("dashboard.parse", dashboard_parse_setup, dashboard_parse),
+    Case("dashboard.ingest", dashboard_ingest_setup, dashboard_ingest),
+    Case("dashboard.rerun", dashboard_rerun_setup, dashboard_rerun),
+    Case("settings.get_setting", settings_setup, settings_get),
+    Case("alerting.feed", alerting_setup, alerting_feed),
+    Case("retention.find_cutoff", find_cutoff_setup, find_cutoff),
+    Case("retention.rotate", rotate_setup, rotate),
+    Case("retention.prune_hot", prune_hot_setup, prune_hot),
+    Case("retention.iter_lines", iter_lines_setup, iter_lines),
+    Case("portscan.parse_line", portscan_setup, portscan_parse),
+    Case("portscan.pipeline", portscan_setup, portscan_pipeline),
+    Case("portscan.pipeline_coalesce", portscan_setup, portscan_pipeline_coalesce),
+    Case("aggregator.ingest_tcp", aggregator_tcp_setup, aggregator_ingest),
+    Case("aggregator.ingest_udp", aggregator_udp_setup, aggregator_ingest),
+]
+
+def select(only: Optional[str]) -> List[Case]:
+    """
+    Cases whose name starts with any comma-separated prefix in `only`.
+    """
+    if not only:
+        return list(CASES)
+    prefixes = [p.strip() for p in only.split(",") if p.strip()]
+    return [c for c in CASES if any(c.name.startswith(p) for p in prefixes)]
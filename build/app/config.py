@@ -7,15 +7,17 @@ import zipfile
 import io
 import uuid 
 import time
+import functools
 
 from utils import (
     load_json, save_json, restart_opencanary,
-    CONFIG_PATH, LOG_PATH,
+    CONFIG_PATH, LOG_PATH, SKIN_DIR,
     load_settings, save_settings,
     get_setting, set_setting, delete_setting
 )
+from backup import list_skins, skin_zip
+from aggregator import read_settings as read_aggregator_settings
 
-SKIN_DIR = "/usr/local/lib/python3.10/dist-packages/opencanary/modules/data/http/skin"
 FTP_BANNERS = [
     "FileZilla Server 0.9",
     "Disk Station FTP server at DiskStation ready.",
@@ -315,6 +317,46 @@ module(load="om{syslog_proto}")
 
     st.write("---")
 
+    # ─── Aggregator (receive events from other canaries) ────────────────────────
+    cfg_agg = read_aggregator_settings()
+    agg_on = st.checkbox(
+        "Enable aggregator (collect events from other canaries)",
+        value=cfg_agg["enabled"], key="cfg_agg_en",
+        help="Point other nodes' remote syslog (or raw JSON lines) at this host; "
+             "the dashboard then offers an All nodes view."
+    )
+    if agg_on:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            agg_bind = st.text_input("Listen address", value=cfg_agg["bind"], key="cfg_agg_bind")
+        with col2:
+            agg_udp = st.number_input("UDP port", min_value=0, max_value=65535,
+                                      value=int(cfg_agg["udp_port"] or 0), key="cfg_agg_udp",
+                                      help="0 disables UDP")
+        with col3:
+            agg_tcp = st.number_input("TCP port", min_value=0, max_value=65535,
+                                      value=int(cfg_agg["tcp_port"] or 0), key="cfg_agg_tcp",
+                                      help="0 disables TCP")
+        if st.button("Save aggregator settings", key="btn_save_agg", use_container_width=True):
+            set_setting("aggregator", {
+                "enabled": True,
+                "bind": agg_bind.strip() or "0.0.0.0",
+                "udp_port": int(agg_udp) or None,
+                "tcp_port": int(agg_tcp) or None,
+            })
+            st.success("Aggregator settings saved; the supervisor restarts it.")
+            time.sleep(2)
+            st.rerun()
+
+    elif cfg_agg["enabled"]:
+        if st.button("Disable aggregator", use_container_width=True):
+            set_setting("aggregator", {**cfg_agg, "enabled": False})
+            st.success("Aggregator disabled.")
+            time.sleep(2)
+            st.rerun()
+
+    st.write("---")
+
     # ─── Alerting settings via helpers ───────────────────────────────────────────
     DEFAULT_CFG = {
         "alert": False,
@@ -355,6 +397,7 @@ module(load="om{syslog_proto}")
 
         if st.button("Save", key="alert_save_button", use_container_width=True):
             set_setting("config", {
+                **cfg_alert,    # keep keys not edited here (e.g. alert_rules)
                 "alert": True,
                 "alert_strings": [s.strip() for s in raw.split(",") if s.strip()],
                 "alert_method": method,
@@ -367,7 +410,7 @@ module(load="om{syslog_proto}")
 
     elif not alert_on and initial_alert:
         if st.button("Disable alerting", use_container_width=True):
-            set_setting("config", DEFAULT_CFG.copy())
+            set_setting("config", {**DEFAULT_CFG, "alert_rules": cfg_alert.get("alert_rules", [])})
             st.success("Alerting disabled.")
             time.sleep(2)
             st.rerun()
@@ -396,28 +439,17 @@ module(load="om{syslog_proto}")
 
     st.write("---")
 
-    # ─── Manage HTTP/S Skins (unchanged) ───────────────────────────────────────
+    # ─── Manage HTTP/S Skins ─────────────────────────────────────────────────
     with st.expander("Manage HTTP/S Skins", expanded=False):
-        skins = [
-            d for d in os.listdir(SKIN_DIR)
-            if os.path.isdir(os.path.join(SKIN_DIR, d))
-        ]
-        for name in skins:
+        # Archives are only built when a download is clicked, then cached by content hash
+        for name in list_skins():
             col_name, col_dl, col_del = st.columns([6,1,1])
             with col_name:
                 st.write(name)
-            mem_zip = io.BytesIO()
-            with zipfile.ZipFile(mem_zip, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                for root, _, files in os.walk(os.path.join(SKIN_DIR, name)):
-                    for file in files:
-                        full = os.path.join(root, file)
-                        arc = os.path.relpath(full, os.path.join(SKIN_DIR, name))
-                        zf.write(full, arc)
-            mem_zip.seek(0)
             with col_dl:
                 st.download_button(
                     label="⬇️",
-                    data=mem_zip,
+                    data=functools.partial(skin_zip, name),
                     file_name=f"{name}.zip",
                     mime="application/zip",
                     key=f"dl_{name}"
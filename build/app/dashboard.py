@@ -1,56 +1,73 @@
 import streamlit as st
-import subprocess
+import datetime
 import pandas as pd, json, altair as alt
-from utils import read_text, LOG_PATH
-
-def render_dashboard():
-
-    # ─── Service status indicators ─────────────────────────────────────────────
-    try:
-        oc = subprocess.run(
-            ["pgrep", "-f", "opencanary"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
+from utils import LOG_PATH, NODE_STATUS, supervisor_status, get_setting, load_json
+from rollup import CHART_WINDOWS, get_rollups, get_node_rollups
+from logquery import get_log_index, get_node_index, parse_query
+
+def format_uptime(secs):
+    secs = int(secs)
+    if secs < 3600:
+        return f"{secs // 60}m {secs % 60}s"
+    if secs < 86400:
+        return f"{secs // 3600}h {secs % 3600 // 60}m"
+    return f"{secs // 86400}d {secs % 86400 // 3600}h"
+
+def service_badge(svc):
+    if not svc:
+        return "❔"
+    if not svc["up"]:
+        if not svc["enabled"]:
+            return "➖ disabled"
+        code = svc.get("last_exit")
+        return "❌" + (f" (exit {code})" if code is not None else "")
+    badge = "✅" if svc.get("ready") is not False else "⚠️ not listening"
+    details = [f"up {format_uptime(svc['uptime'])}", f"{svc['rss'] / 2**20:.0f} MiB", f"{svc['cpu']:.0f}% CPU"]
+    if svc["restarts"]:
+        details.append(f"{svc['restarts']} restart(s)")
+    return f"{badge} :gray[{' · '.join(details)}]"
+
+def render_nodes(status):
+    # Per-node ingest counters from aggregator.py's snapshot
+    nodes = status.get("nodes", {})
+    with st.expander(f"Nodes ({len(nodes)})", expanded=False):
+        st.caption(
+            f"{status.get('events_per_sec', 0):.0f} events/s · {status.get('stored', 0)} stored · "
+            f"{status.get('malformed', 0)} malformed · {status.get('duplicates', 0)} duplicate · "
+            f"{status.get('dropped', 0)} dropped · "
+            f"{status.get('connections', 0)} TCP connection(s)"
         )
-        oc_status = "✅" if oc.returncode == 0 else "❌"
-    except Exception:
-        oc_status = "❌"
-
-    try:
-        rs = subprocess.run(
-            ["pgrep", "-f", "rsyslogd"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        rs_status = "✅" if rs.returncode == 0 else "❌"
-    except Exception:
-        rs_status = "❌"
+        if nodes:
+            st.dataframe(
+                pd.DataFrame(
+                    [(name, n["events"], datetime.datetime.fromtimestamp(n["last_seen"]), n["peer"])
+                     for name, n in sorted(nodes.items())],
+                    columns=["node_id", "events", "last seen", "peer"]
+                ),
+                hide_index=True, use_container_width=True
+            )
 
+def fetch_log_page(index, q):
+    # One index page after the stored keyset cursor, appended to the viewer
+    page, cursor = index.page(q, st.session_state.log_cursor)
+    for line in page:
+        try:
+            st.session_state.log_entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    st.session_state.log_cursor = cursor
 
-    try:
-        al = subprocess.run(
-            ["pgrep", "-f", "alert"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        al_status = "✅" if al.returncode == 0 else "❌"
-    except Exception:
-        al_status = "❌"
-
-    try:
-        ps = subprocess.run(
-            ["pgrep", "-f", "portscan_patch.sh"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        ps_status = "✅" if ps.returncode == 0 else "❌"
-    except Exception:
-        ps_status = "❌"
+def render_dashboard():
 
-    st.write("**OpenCanary:**", oc_status)
-    st.write("**rsyslog:**",   rs_status)
-    st.write("**alerting system:**",   al_status)
-    st.write("**portscan mod:**",   ps_status)
+    # ─── Service status indicators (snapshot from supervisor.py) ─────────────
+    services = supervisor_status().get("services", {})
+    for label, name in (("OpenCanary", "opencanary"), ("rsyslog", "rsyslog"),
+                        ("alerting system", "alerting"), ("indexer", "indexer"),
+                        ("portscan mod", "portscan")):
+        st.write(f"**{label}:**", service_badge(services.get(name)))
+    aggregating = get_setting("aggregator.enabled", False) is True
+    if aggregating:
+        st.write("**aggregator:**", service_badge(services.get("aggregator")))
 
 
     # ─── Handle centered→wide one‑time rerun ────────────────────────────────────
@@ -60,138 +77,131 @@ def render_dashboard():
 
     st.write("---")
 
-    # ─── Load and parse logs ────────────────────────────────────────────────────
-    raw = read_text(LOG_PATH)
-    if not raw:
-        return st.info(f"No logs at {LOG_PATH}")
+    # ─── Source: this node's log, or it plus every node forwarding to it ─────
+    all_nodes = aggregating and st.radio(
+        "Source", ["This node", "All nodes"], horizontal=True, key="log_source",
+        label_visibility="collapsed"
+    ) == "All nodes"
+
+    # ─── Index and rollups (indexer.py / aggregator.py own them; read-only here)
+    if all_nodes:
+        status = load_json(NODE_STATUS)
+        render_nodes(status)
+        rollups = get_node_rollups()
+        index = get_node_index()
+        if index is None or not status.get("nodes"):
+            return st.info("No events aggregated yet")
+    else:
+        rollups = get_rollups()
+        index = get_log_index()
+        if index is None or index.empty():
+            return st.info(f"No logs indexed from {LOG_PATH} yet")
 
     # ─── Filter bar + Search/Refresh ────────────────────────────────────────────
     col1, col2 = st.columns([4, 1])
     with col1:
         query = st.text_input(
-            "Filter logs (use -substring to exclude)",
-            value="-888 -1001",  # Default: exclude logtype 888 and 1001
+            "Filter logs (e.g. logtype:3001 src_host:10.0.0.0/8 dst_port:22 since:2h; -term excludes)",
+            value="-888 -1001",  # Default: exclude logtype 888 and 1001 (indexed logtype filters)
             key="filter"
         )
     with col2:
         st.markdown('<div style="padding-top:27px;"></div>', unsafe_allow_html=True)
         if st.button("Search/Refresh", key="search_refresh", use_container_width=True):
+            st.session_state.pop("log_query", None)     # refetch the newest lines
             st.rerun()
 
-    # ─── Filter parsing ─────────────────────────────────────────────────────────
-    include_patterns = []
-    exclude_patterns = []
-    for part in query.split():
-        if part.startswith("-") and len(part) > 1:
-            exclude_patterns.append(part[1:].lower())
-        elif part:
-            include_patterns.append(part.lower())
-
-    # ─── Entries for Graph (filtered) ───────────────────────────────────────────
-    entries = []
-    for line in raw.splitlines():
-        text = line.lower()
-        # Must match ALL includes (if set) and NONE of the excludes
-        if include_patterns and not any(p in text for p in include_patterns):
-            continue
-        if any(e in text for e in exclude_patterns):
-            continue
-        try:
-            obj = json.loads(line)
-            ts = obj.get("local_time_adjusted")
-            entries.append({
-                "timestamp": pd.to_datetime(ts),
-                "logtype": obj.get("logtype")
-            })
-        except (json.JSONDecodeError, TypeError, ValueError):
-            continue
-
-    # Restrict to last 6 hours
-    now   = pd.Timestamp.now()
-    start = now - pd.Timedelta(hours=6)
-    df = pd.DataFrame(entries)
-
-    # Keep only timestamps in the window
-    if "timestamp" in df.columns:
-        df = df[(df["timestamp"] >= start) & (df["timestamp"] <= now)]
-    else:
-        df = pd.DataFrame({"timestamp": [], "count": []})
-
-    # Bucket into 5‑minute bins and fill missing with zeros
-    if not df.empty:
-        df = (
-            df
-            .groupby(pd.Grouper(key="timestamp", freq="5min"))
-            .size()
-            .reset_index(name="count")
-        )
-        # ensure every 5 min interval is present
-        all_bins = pd.date_range(
-            start=start.floor("5min"),
-            end=now.ceil("5min"),
-            freq="5min"
+    # ─── Filter parsing (field:value terms, see logquery) ───────────────────────
+    q = parse_query(query)
+    viewer_key = (all_nodes, query)
+    if st.session_state.get("log_query") != viewer_key:
+        # Viewer state: lines fetched so far and the cursor after them
+        st.session_state.log_query = viewer_key
+        st.session_state.log_entries = []
+        st.session_state.log_cursor = None
+        fetch_log_page(index, q)
+
+    # ─── Activity series (pre-aggregated rollups when the filter allows) ────────
+    # Logtype-only filters map onto the rollups; anything else is counted
+    # from the index.
+    col_w, col_s = st.columns([4, 1])
+    with col_w:
+        window_label = st.selectbox(
+            "Window",
+            options=list(CHART_WINDOWS),
+            index=list(CHART_WINDOWS).index("6 hours"),
+            key="chart_window",
+            label_visibility="collapsed"
         )
-        df = (
-            df
-            .set_index("timestamp")
-            .reindex(all_bins, fill_value=0)
-            .rename_axis("timestamp")
-            .reset_index()
+    with col_s:
+        if all_nodes:
+            split = st.selectbox(
+                "Split", ["Total", "By logtype", "By node"], key="chart_split_nodes",
+                label_visibility="collapsed"
+            )
+            group_by = {"By logtype": "logtype", "By node": "node_id"}.get(split)
+        else:
+            group_by = "logtype" if st.toggle("By logtype", value=False, key="chart_split") else None
+    window, res = CHART_WINDOWS[window_label]
+
+    if q.rollup_ok:
+        rows = rollups.series(
+            window, res,
+            include_logtypes=q.logtypes_in,
+            exclude_logtypes=q.logtypes_out,
+            group_by=group_by
         )
     else:
-        df = pd.DataFrame({"timestamp": [], "count": []})
+        rows = index.histogram(q, window, res, group_by=group_by)
+
+    df = pd.DataFrame(
+        [(datetime.datetime.fromtimestamp(b), g, n) for b, g, n in rows],
+        columns=["timestamp", "group", "count"]
+    )
 
     # ─── Chart ─────────────────────────────────────────────────────────────────
-    with st.expander("Activity over last 6 hours", expanded=True):
-        chart = (
-            alt.Chart(df)
-            .mark_line(point=True)
-            .encode(
-                x=alt.X("timestamp:T", axis=alt.Axis(title=None)),
-                y=alt.Y("count:Q",    axis=alt.Axis(title=None)),
-                tooltip=[
-                    alt.Tooltip("timestamp", type="temporal",     title="Time"),
-                    alt.Tooltip("count",     type="quantitative", title="Events"),
-                ]
+    with st.expander(f"Activity over last {window_label}", expanded=True):
+        tooltip = [
+            alt.Tooltip("timestamp", type="temporal",     title="Time"),
+            alt.Tooltip("count",     type="quantitative", title="Events"),
+        ]
+        if group_by:
+            chart = (
+                alt.Chart(df)
+                .mark_area()
+                .encode(
+                    x=alt.X("timestamp:T", axis=alt.Axis(title=None)),
+                    y=alt.Y("count:Q",     axis=alt.Axis(title=None), stack=True),
+                    color=alt.Color("group:N", legend=alt.Legend(title=None)),
+                    tooltip=tooltip + [alt.Tooltip("group", type="nominal",
+                                                   title="Node" if group_by == "node_id" else "Logtype")]
+                )
+                .properties(height=200)
+            )
+        else:
+            chart = (
+                alt.Chart(df)
+                .mark_line(point=True)
+                .encode(
+                    x=alt.X("timestamp:T", axis=alt.Axis(title=None)),
+                    y=alt.Y("count:Q",    axis=alt.Axis(title=None)),
+                    tooltip=tooltip
+                )
+                .properties(height=200)
             )
-            .properties(height=200)
-        )
         st.altair_chart(chart, use_container_width=True)
 
     st.write("---")
 
-    # ─── Log viewer (single event expanders, filtered the same as above) ────────
-    lines = []
-    for l in raw.splitlines():
-        text = l.lower()
-        if include_patterns and not any(p in text for p in include_patterns):
-            continue
-        if any(e in text for e in exclude_patterns):
-            continue
-        lines.append(l)
-
-    tail = lines[-200:] if len(lines) > 200 else lines
-    tail.reverse()
-
-    logs = []
-    for line in tail:
-        try:
-            entry = json.loads(line)
-            logs.append(entry)
-        except json.JSONDecodeError:
-            continue
-
-    if "show_logs" not in st.session_state:
-        st.session_state.show_logs = 10
-
-    logs_to_show = logs[: st.session_state.show_logs]
-
-    for entry in logs_to_show:
+    # ─── Log viewer (newest first, one index page per "Show more") ─────────────
+    for entry in st.session_state.log_entries:
         time   = entry.get("local_time_adjusted", "")
         src   = entry.get("src_host", "")
         dst   = entry.get("dst_host", "")
         ltype = entry.get("logtype", "")
         header = f"{time} - [type {ltype}]"
+        if all_nodes:
+            header += f" - {entry.get('node_id', '')}"
         with st.expander(header):
             for key, val in entry.items():
                 if key != "logdata":
@@ -200,7 +210,7 @@ def render_dashboard():
                 st.write("**logdata**:")
                 st.json(entry["logdata"])
 
-    if len(logs) > st.session_state.show_logs:
-        if st.button("Show more logs", key="show_more_logs_button", use_container_width=True):
-            st.session_state.show_logs += 10
-            st.rerun()
+    if st.session_state.log_cursor is not None:
+        # The callback runs before the rerun, so only the next page is queried
+        st.button("Show more logs", key="show_more_logs_button", use_container_width=True,
+                  on_click=fetch_log_page, args=(index, q))
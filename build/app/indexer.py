@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# indexer.py
+#
+# Folds this node's hot log into the SQLite index (logquery) and the
+# rollups (rollup) as lines are appended, whether or not anyone has the
+# dashboard open; the dashboard only reads both. Archived segments not in
+# the index yet (written before it existed, or while this service was down)
+# are backfilled at start and then every BACKFILL_INTERVAL; the names of
+# segments done are kept in the index's meta table.
+#
+# retention.py only archives hot-log lines both have already read (see
+# retention.consumed_offset), so a rotation never takes lines away before
+# they are indexed and counted.
+#
+import os
+import json
+import time
+import signal
+import datetime
+import threading
+
+from utils import LOG_PATH, INDEX_FILE, ROLLUP_FILE, ARCHIVE_DIR
+from logstore import LogCache
+from logquery import LogIndex
+from rollup import RollupStore
+from retention import segment_paths, segment_lines
+
+POLL_INTERVAL = 0.5        # secs between looks at the hot log once caught up
+BATCH_LINES   = 20000      # lines parsed per refresh while catching up
+SAVE_INTERVAL = 5          # secs between rollup saves (the chart's freshness)
+BACKFILL_INTERVAL = 3600   # secs between looks for archived segments to index
+
+terminate = False
+
+def handler(signum, frame):
+    global terminate
+    print("[*] Received signal to terminate. Exiting cleanly...")
+    terminate = True
+
+def now_str() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+class Indexer:
+    def __init__(self, log_path: str = LOG_PATH, index_path: str = INDEX_FILE,
+                 rollup_path: str = ROLLUP_FILE, archive_dir: str = ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self.cache = LogCache(log_path)
+        # Both attach before the first refresh so no line is missed
+        self.rollups = RollupStore(rollup_path, save_interval=SAVE_INTERVAL)
+        self.rollups.attach(self.cache)
+        self.index = LogIndex(index_path)
+        self.index.attach(self.cache)
+        self._next_backfill = 0.0
+        self._backfilling = False
+
+    def backfill(self) -> int:
+        """
+        Index every archived segment not indexed yet; returns how many.
+        Segments never change once written, so each is read once.
+        """
+        segments = {os.path.basename(p): p for p in segment_paths(self.archive_dir)}
+        done = set(json.loads(self.index.get_meta("segments").get("segments") or "[]"))
+        done &= set(segments)       # forget expired segments
+        todo = sorted(set(segments) - done)
+        for name in todo:
+            try:
+                n = self.index.backfill(segment_lines(segments[name]))
+            except FileNotFoundError:
+                continue            # expired meanwhile
+            done.add(name)
+            self.index.set_meta(segments=json.dumps(sorted(done)))
+            print(f"[{now_str()}] Indexed {n} archived line(s) from {name}")
+        return len(todo)
+
+    def backfill_if_due(self) -> None:
+        # In a thread: a first backfill of months of segments must not stall live lines
+        if self._backfilling or time.monotonic() < self._next_backfill:
+            return
+        self._backfilling = True
+        self._next_backfill = time.monotonic() + BACKFILL_INTERVAL
+        threading.Thread(target=self._backfill_background, daemon=True).start()
+
+    def _backfill_background(self) -> None:
+        try:
+            self.backfill()
+        except Exception as e:
+            print(f"[!] Backfill failed: {e}")
+        finally:
+            self._backfilling = False
+
+    def tick(self) -> int:
+        """
+        Ingest up to BATCH_LINES new lines and do due maintenance; returns
+        how many lines were read.
+        """
+        n = len(self.cache.refresh(BATCH_LINES))
+        self.rollups.save_if_due()
+        self.index.prune_if_due()
+        self.backfill_if_due()
+        return n
+
+def main():
+    indexer = Indexer()
+    print(f"[{now_str()}] Indexing {LOG_PATH}")
+    while not terminate:
+        try:
+            n = indexer.tick()
+        except Exception as e:
+            print(f"[!] Indexing pass failed: {e}")
+            n = 0
+        if n < BATCH_LINES:
+            time.sleep(POLL_INTERVAL)
+    indexer.rollups.save()
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    main()
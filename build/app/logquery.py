@@ -0,0 +1,418 @@
+import os
+import re
+import time
+import shlex
+import sqlite3
+import hashlib
+import datetime
+import ipaddress
+import threading
+import functools
+from typing import Dict, List, Optional, Tuple
+
+from utils import get_setting, INDEX_FILE, NODE_INDEX_FILE
+from logstore import LogCache, LogEvent, parse_event
+
+# ——— Query syntax ————————————————————————————————————————————————
+#
+#   3001  logtype:3001      logtype (bare numbers are logtypes)
+#   src_host:10.0.0.0/8     source IP or CIDR (other values match the text)
+#   dst_port:22  dst_port:20-25
+#   node_id:canary-1
+#   since:2h  since:7d      relative time range (m, h, d)
+#   after:2025-07-30  before:2025-07-30T12:00
+#   anything else           case-insensitive substring of the raw line
+#   -term                   negates any of the above
+#
+# Terms on the same field are OR'ed, different fields are AND'ed, and every
+# negated term must hold, so the default "-888 -1001" excludes two logtypes.
+
+FIELDS = ("logtype", "src_host", "dst_port", "node_id")
+RE_RELATIVE = re.compile(r"^(\d+(?:\.\d+)?)([mhd])$")
+PAGE_SIZE = 10
+PRUNE_INTERVAL = 3600   # secs between dropping index rows past log_expiry
+
+class Query:
+    def __init__(self):
+        self.positive = {}      # group -> [(sql, params)], OR'ed within a group
+        self.negative = []      # [(sql, params)], each must not match
+        self.logtypes_in: List[str] = []
+        self.logtypes_out: List[str] = []
+        self.rollup_ok = True   # expressible as a logtype-only rollup filter
+
+    def add(self, group: str, sql: str, params: list, negate: bool) -> None:
+        if negate:
+            self.negative.append((sql, params))
+        else:
+            self.positive.setdefault(group, []).append((sql, params))
+
+    def where(self) -> Tuple[str, list]:
+        clauses, params = [], []
+        for terms in self.positive.values():
+            clauses.append("(" + " OR ".join(sql for sql, _ in terms) + ")")
+            for _, p in terms:
+                params.extend(p)
+        for sql, p in self.negative:
+            clauses.append(f"NOT COALESCE({sql}, 0)")
+            params.extend(p)
+        return (" AND ".join(clauses) or "1"), params
+
+@functools.lru_cache(maxsize=65536)
+def _ip_int(value: str) -> Optional[int]:
+    try:
+        addr = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    return int(addr) if addr.version == 4 else None
+
+def _parse_time_term(value: str, now: float) -> Optional[float]:
+    m = RE_RELATIVE.match(value)
+    if m:
+        n, unit = float(m.group(1)), m.group(2)
+        return now - n * {"m": 60, "h": 3600, "d": 86400}[unit]
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+def _like(text: str) -> str:
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def parse_query(text: str, now: Optional[float] = None) -> Query:
+    now = time.time() if now is None else now
+    q = Query()
+    try:
+        parts = shlex.split(text)
+    except ValueError:
+        parts = text.split()
+    for part in parts:
+        negate = part.startswith("-") and len(part) > 1
+        if negate:
+            part = part[1:]
+        field, sep, value = part.partition(":")
+        field = field.lower()
+        if not sep or not value or field not in FIELDS + ("since", "after", "before"):
+            field, value = "", part
+
+        if field == "logtype" or (not field and part.isdigit()):
+            try:
+                logtype = int(value)
+            except ValueError:
+                q.add("logtype", "logtype = ?", [value], negate)
+                q.rollup_ok = False
+                continue
+            q.add("logtype", "logtype = ?", [logtype], negate)
+            (q.logtypes_out if negate else q.logtypes_in).append(str(logtype))
+            continue
+
+        q.rollup_ok = False
+        if field == "src_host":
+            try:
+                net = ipaddress.ip_network(value, strict=False)
+            except ValueError:
+                net = None
+            if net is not None and net.version == 4:
+                lo, hi = int(net.network_address), int(net.broadcast_address)
+                if lo == hi:
+                    # Equality keeps the (src_ip, ts) index usable for newest-first order
+                    q.add("src_host", "src_ip = ?", [lo], negate)
+                else:
+                    # Unary + keeps ranges off the index so pages walk ts order
+                    q.add("src_host", "+src_ip BETWEEN ? AND ?", [lo, hi], negate)
+            else:
+                q.add("src_host", "src_host = ?", [value], negate)
+        elif field == "dst_port":
+            lo_s, _, hi_s = value.partition("-")
+            try:
+                lo, hi = int(lo_s), int(hi_s or lo_s)
+            except ValueError:
+                continue
+            if lo == hi:
+                q.add("dst_port", "dst_port = ?", [lo], negate)
+            else:
+                q.add("dst_port", "+dst_port BETWEEN ? AND ?", [lo, hi], negate)
+        elif field == "node_id":
+            q.add("node_id", "node_id = ?", [value], negate)
+        elif field in ("since", "after", "before"):
+            ts = _parse_time_term(value, now)
+            if ts is None:
+                continue
+            op = "<" if field == "before" else ">="
+            if negate:
+                op = ">=" if op == "<" else "<"
+            q.add(f"time_{op}", f"ts {op} ?", [ts], False)
+        else:
+            q.add("text", "line LIKE ? ESCAPE '\\'", [_like(value)], negate)
+    return q
+
+# ——— Index ————————————————————————————————————————————————————
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id       INTEGER PRIMARY KEY,
+    ts       REAL,
+    logtype  INTEGER,
+    src_host TEXT,
+    src_ip   INTEGER,
+    dst_port INTEGER,
+    node_id  TEXT,
+    digest   INTEGER UNIQUE,
+    line     TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts       ON events(ts);
+CREATE INDEX IF NOT EXISTS events_logtype  ON events(logtype, ts);
+CREATE INDEX IF NOT EXISTS events_src_ip   ON events(src_ip, ts);
+-- IPv4 sources (all OpenCanary records) are found through events_src_ip; an
+-- index on the src_host text only slowed every insert
+DROP INDEX IF EXISTS events_src_host;
+CREATE INDEX IF NOT EXISTS events_dst_port ON events(dst_port, ts);
+CREATE INDEX IF NOT EXISTS events_node_id  ON events(node_id, ts);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+INSERT = (
+    "INSERT OR IGNORE INTO events "
+    "(ts, logtype, src_host, src_ip, dst_port, node_id, digest, line) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+def _digest(line: str) -> int:
+    return int.from_bytes(hashlib.blake2b(line.encode("utf-8", "replace"), digest_size=8).digest(), "big", signed=True)
+
+class IndexReader:
+    """
+    Query-only view of an index another process writes (indexer.py's or the
+    aggregator's): opened read-only, so the UI never runs schema changes,
+    PRAGMAs or VACUUM against a database that is being written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def get_meta(self, *keys: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute(
+                f"SELECT key, value FROM meta WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall())
+
+    def empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM events LIMIT 1").fetchone() is None
+
+    # ─── Queries ────────────────────────────────────────────────────────────────
+    def page(self, query: Query, cursor: Optional[Tuple[float, int]] = None,
+             limit: int = PAGE_SIZE) -> Tuple[List[str], Optional[Tuple[float, int]]]:
+        """
+        Up to `limit` matching lines, newest first, and the cursor for the
+        next page (None when there are no more rows).
+        """
+        where, params = query.where()
+        if cursor is not None:
+            where += " AND ts <= ? AND NOT (ts = ? AND id >= ?)"
+            params = params + [cursor[0], cursor[0], cursor[1]]
+        sql = (
+            f"SELECT id, ts, line FROM events WHERE ts IS NOT NULL AND {where} "
+            "ORDER BY ts DESC, id DESC LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit + 1]).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = (rows[-1][1], rows[-1][0]) if more and rows else None
+        return [line for _, _, line in rows], next_cursor
+
+    def histogram(self, query: Query, window: int, res: int,
+                  group_by: Optional[str] = None, now: Optional[float] = None) -> List[Tuple[int, str, int]]:
+        """
+        Rows of (bucket_start, group, count), zero-filled, in the same shape
+        as rollup.RollupStore.series, for filters the rollups cannot express.
+        """
+        now = time.time() if now is None else now
+        first = int((now - window) // res) * res
+        last = int(now // res) * res
+        where, params = query.where()
+        group_sql = group_by if group_by in FIELDS else "''"
+        sql = (
+            f"SELECT CAST(ts / ? AS INTEGER) * ?, {group_sql}, COUNT(*) FROM events "
+            f"WHERE ts >= ? AND ts < ? AND {where} GROUP BY 1, 2"
+        )
+        with self._lock:
+            found = self._conn.execute(sql, [res, res, first, last + res] + params).fetchall()
+        totals = {(int(b), str(g) if g is not None else ""): n for b, g, n in found}
+        groups = sorted({g for _, g in totals}) or [""]
+        return [
+            (b, g, totals.get((b, g), 0))
+            for b in range(first, last + res, res)
+            for g in groups
+        ]
+
+class LogIndex(IndexReader):
+    """
+    SQLite index of every retained log line, keyed on the query fields.
+    Rows are deduplicated by a line digest, so re-reading the hot log after
+    a rotation (or backfilling from archived segments) never doubles rows.
+    """
+
+    def __init__(self, path: str = INDEX_FILE):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Pages freed by pruning go back to the filesystem (see prune_if_due).
+        # An index created before this setting is converted once by VACUUM.
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            if self._conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+                self._conn.execute("VACUUM")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._last_ts: Optional[float] = None
+        self._last_prune = 0.0
+
+    # ─── Maintenance ────────────────────────────────────────────────────────────
+    def attach(self, cache: LogCache) -> None:
+        """
+        Index lines as the cache reads them. The inode/offset indexed so far
+        is kept in the database, so after a restart the lines the cache
+        re-reads are skipped instead of being digested again.
+        """
+        follower = cache.follower
+        saved = self.get_meta("inode", "offset")
+        state = {"inode": saved.get("inode"), "offset": int(saved.get("offset") or 0)}
+
+        def on_events(new: List[LogEvent], reset: bool) -> None:
+            if reset or str(follower.inode) != state["inode"]:
+                state["offset"] = 0
+            skip = state["offset"]
+            self.add([ev for ev in new if ev.offset >= skip] if skip else new)
+            state["inode"], state["offset"] = str(follower.inode), follower.offset
+            self.set_meta(inode=state["inode"], offset=state["offset"])
+
+        cache.listeners.append(on_events)
+
+    def set_meta(self, **values) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [(k, str(v)) for k, v in values.items()],
+            )
+
+    def _rows(self, events: List[LogEvent]) -> list:
+        rows = []
+        for ev in events:
+            if ev.ts is not None:
+                ts = ev.ts.timestamp()
+                self._last_ts = ts
+            else:
+                ts = self._last_ts    # keep untimestamped lines next to their neighbours
+            try:
+                logtype = int(ev.logtype) if ev.logtype is not None else None
+            except (TypeError, ValueError):
+                logtype = None
+            rows.append((
+                ts, logtype, ev.src_host or None, _ip_int(ev.src_host) if ev.src_host else None,
+                ev.dst_port, ev.node_id or None, _digest(ev.line), ev.line,
+            ))
+        return rows
+
+    def add(self, events: List[LogEvent]) -> None:
+        rows = self._rows(events)
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(INSERT, rows)
+
+    def add_new(self, events: List[LogEvent]) -> List[LogEvent]:
+        """
+        add() the events and return those whose line was not indexed yet
+        (nor repeated earlier in `events`), so callers that also store or
+        count events can skip the duplicates too.
+        """
+        rows = self._rows(events)
+        if not rows:
+            return []
+        with self._lock, self._conn:
+            last_id = self._conn.execute("SELECT MAX(id) FROM events").fetchone()[0] or 0
+            before = self._conn.total_changes
+            self._conn.executemany(INSERT, rows)
+            if self._conn.total_changes - before == len(rows):
+                return list(events)         # the usual case: nothing was a duplicate
+            # Rows inserted just now are the ones with a higher id
+            inserted = {d for (d,) in self._conn.execute("SELECT digest FROM events WHERE id > ?", (last_id,))}
+        new = []
+        for ev, row in zip(events, rows):
+            if row[6] in inserted:
+                inserted.discard(row[6])    # a repeat later in the batch is not new
+                new.append(ev)
+        return new
+
+    def backfill(self, lines) -> int:
+        """
+        Index raw lines (e.g. one archived segment via retention.segment_lines);
+        lines already indexed are skipped by their digest. Returns how many
+        lines were read.
+        """
+        n = 0
+        batch = []
+        for raw in lines:
+            batch.append(parse_event(0, raw))
+            if len(batch) >= 5000:
+                self.add(batch)
+                n += len(batch)
+                batch = []
+        self.add(batch)
+        return n + len(batch)
+
+    def prune_if_due(self) -> None:
+        """
+        Drop rows older than logman.log_expiry, at most once per PRUNE_INTERVAL,
+        and hand the freed pages back to the filesystem.
+        """
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            days = float(get_setting("logman.log_expiry", 0) or 0)
+        except (TypeError, ValueError):
+            return
+        if days <= 0:
+            return
+        with self._lock:
+            with self._conn:
+                deleted = self._conn.execute("DELETE FROM events WHERE ts < ?", (now - days * 86400,)).rowcount
+            if deleted:
+                # executescript steps the pragma to completion; execute() frees one page
+                self._conn.executescript("PRAGMA incremental_vacuum;")
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+_readers: Dict[str, IndexReader] = {}
+_readers_lock = threading.Lock()
+
+def _reader(path: str) -> Optional[IndexReader]:
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is None and os.path.exists(path):
+            reader = _readers[path] = IndexReader(path)
+        return reader
+
+def get_log_index() -> Optional[IndexReader]:
+    """
+    Process-wide reader of this node's index, or None until indexer.py has
+    created it. indexer.py writes, backfills and prunes it; the dashboard
+    only queries.
+    """
+    return _reader(INDEX_FILE)
+
+def get_node_index() -> Optional[IndexReader]:
+    """
+    Process-wide reader of the aggregator's index (all nodes), or None until
+    the aggregator has created it.
+    """
+    return _reader(NODE_INDEX_FILE)
@@ -0,0 +1,232 @@
+import os
+import json
+import datetime
+import threading
+from itertools import islice
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils import load_json, save_json
+
+# ——— Parsed events ————————————————————————————————————————————
+
+class LogEvent(NamedTuple):
+    offset: int                           # byte offset of the line in the log file
+    ts: Optional[datetime.datetime]       # parsed local_time_adjusted, if any
+    logtype: Any
+    src_host: str
+    dst_port: Optional[int]
+    node_id: str
+    line: str
+
+def decode_line(b: bytes) -> str:
+    # Same fallback order as utils.read_text, applied per line
+    for enc in ("utf-8", "cp1252"):
+        try:
+            return b.decode(enc)
+        except UnicodeDecodeError:
+            pass
+    return b.decode("utf-8", "ignore")
+
+def parse_time(value: Any) -> Optional[datetime.datetime]:
+    """
+    Parse an OpenCanary timestamp ('2025-07-30 14:08:23.123456') into a naive datetime.
+    """
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        dt = None
+        for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+            try:
+                dt = datetime.datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+def parse_event(offset: int, raw: bytes) -> LogEvent:
+    line = decode_line(raw).rstrip("\r\n")
+    try:
+        obj = json.loads(line)
+    except (json.JSONDecodeError, ValueError):
+        return LogEvent(offset, None, None, "", None, "", line)
+    if not isinstance(obj, dict):
+        return LogEvent(offset, None, None, "", None, "", line)
+    return event_from_obj(offset, obj, line)
+
+def event_from_obj(offset: int, obj: dict, line: str) -> LogEvent:
+    """
+    LogEvent for a line whose JSON object the caller has already decoded.
+    """
+    try:
+        dst_port = int(obj.get("dst_port"))
+    except (TypeError, ValueError):
+        dst_port = None
+    return LogEvent(
+        offset,
+        parse_time(obj.get("local_time_adjusted")),
+        obj.get("logtype"),
+        str(obj.get("src_host") or ""),
+        dst_port,
+        str(obj.get("node_id") or ""),
+        line,
+    )
+
+# ——— Hot log start ————————————————————————————————————————————
+#
+# retention.py never rewrites the hot log (opencanaryd and app.py keep
+# appending to it). It drops old lines by recording the offset of the first
+# retained line in <log>.start and punching out the bytes before it, so
+# readers start there instead of at 0.
+
+START_SUFFIX = ".start"
+
+def hot_start(path: str, st: Optional[os.stat_result] = None) -> int:
+    """
+    Offset of the first retained line of `path`, or 0 if none is recorded
+    for the file as it is now (another inode, or truncated below it).
+    """
+    if st is None:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return 0
+    mark = load_json(path + START_SUFFIX)
+    offset = mark.get("offset")
+    if mark.get("inode") != st.st_ino or not isinstance(offset, int) or not 0 < offset <= st.st_size:
+        return 0
+    return offset
+
+def set_hot_start(path: str, offset: int) -> None:
+    save_json(path + START_SUFFIX, {"inode": os.stat(path).st_ino, "offset": offset}, indent=None)
+
+def clear_hot_start(path: str) -> None:
+    # After rewriting the log wholesale (e.g. the Settings editor)
+    try:
+        os.remove(path + START_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+# ——— File follower ————————————————————————————————————————————
+
+class LogFollower:
+    """
+    Remember the inode and byte offset last read from a log file and hand back
+    only the complete lines appended since. A new inode (rotation), a file
+    shorter than the offset (truncation) or a changed first line (file
+    rewritten in place, or an inode reused) restarts from the beginning,
+    i.e. from hot_start(). The start moving forward (retention dropping old
+    lines) is not a rewrite: reading just continues, skipping ahead if the
+    dropped lines had not been read yet.
+    """
+
+    HEAD_BYTES = 128
+
+    def __init__(self, path: str, offset: int = 0, inode: Optional[int] = None):
+        self.path = path
+        self.offset = offset
+        self.inode = inode
+        self.start = 0        # hot_start() the head was read at
+        self.head = b""
+        self._size = 0
+
+    def _read_head(self) -> bytes:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.start)
+                return f.read(self.HEAD_BYTES)
+        except FileNotFoundError:
+            return b""
+
+    def sync(self) -> bool:
+        """
+        Stat the file; returns True if the previous position is no longer valid.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            reset = self.offset > 0
+            self.offset, self.inode, self.start, self.head, self._size = 0, None, 0, b"", 0
+            return reset
+        start = hot_start(self.path, st)
+        reset = False
+        if self.inode is not None and (st.st_ino != self.inode or st.st_size < self.offset or start < self.start):
+            reset = True
+        elif start > self.start:
+            # Old lines dropped: re-anchor the head on the new first line
+            self.start = start
+            self.offset = max(self.offset, start)
+            self.head = b""
+        elif self.offset > self.start and len(self.head) < self.HEAD_BYTES:
+            # Head not fully captured yet: it may still grow, only compare the prefix
+            reset = not self._read_head().startswith(self.head)
+        elif self.offset > self.start:
+            reset = self._read_head() != self.head
+        if reset:
+            self.start = self.offset = start
+        elif self.inode is None:
+            self.start, self.offset = start, max(self.offset, start)
+        if self.offset == self.start or len(self.head) < self.HEAD_BYTES:
+            self.head = self._read_head()
+        self.inode = st.st_ino
+        self._size = st.st_size
+        return reset
+
+    def read_lines(self) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yield (offset, raw_line) for complete lines between the offset and the
+        size seen by the last sync(). A trailing partial line is left for later.
+        The offset moves past each line as it is yielded, so a caller may stop
+        early and resume there.
+        """
+        if self._size <= self.offset:
+            return
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self.offset)
+            pos = self.offset
+            for raw in f:
+                if not raw.endswith(b"\n") or pos + len(raw) > self._size:
+                    break
+                self.offset = pos + len(raw)
+                yield pos, raw
+                pos += len(raw)
+
+    def seek_end(self) -> None:
+        """
+        Skip everything currently in the file (only lines written later are read).
+        """
+        self.sync()
+        self.offset = self._size
+
+# ——— Incremental parser ——————————————————————————————————————————
+
+class LogCache:
+    """
+    Incremental parser of one log file. Nothing is kept: listeners (the
+    index and rollups) are called as fn(new_events, reset) after each
+    refresh that saw changes.
+    """
+
+    def __init__(self, path: str):
+        self.follower = LogFollower(path)
+        self.listeners: List[Callable[[List[LogEvent], bool], None]] = []
+        self._lock = threading.Lock()
+
+    def refresh(self, limit: Optional[int] = None) -> List[LogEvent]:
+        """
+        Parse lines appended since the last refresh, at most `limit` of them.
+        """
+        with self._lock:
+            reset = self.follower.sync()
+            new = [parse_event(off, raw) for off, raw in islice(self.follower.read_lines(), limit)]
+            if new or reset:
+                for fn in self.listeners:
+                    fn(new, reset)
+            return new
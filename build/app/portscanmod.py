@@ -3,10 +3,13 @@ import subprocess
 import time
 import re
 import os
+import json
 import random
 import socket
 import signal
 import sys
+import argparse
+import threading
 
 def get_default_interface():
     try:
@@ -46,8 +49,13 @@ TCPDUMP_CMD = [
     "tcpdump", "-nnl", "-tt", "-i", INTERFACE,
     f"(tcp[tcpflags] & tcp-syn != 0 and tcp[tcpflags] & tcp-ack == 0 or udp) and dst host {HOST_IP}"
 ]
-RE_TCP = re.compile(r"(\d+\.\d+\.\d+\.\d+)\.(\d+) > (\d+\.\d+\.\d+\.\d+)\.(\d+): Flags \[S\]")
-RE_UDP = re.compile(r"(\d+\.\d+\.\d+\.\d+)\.(\d+) > (\d+\.\d+\.\d+\.\d+)\.(\d+): UDP")
+# One pass per line for both TCP SYNs and UDP datagrams
+RE_PKT = re.compile(r"(\d+\.\d+\.\d+\.\d+)\.(\d+) > (\d+\.\d+\.\d+\.\d+)\.(\d+): (?:(Flags \[S\])|UDP)")
+FLUSH_BYTES = 64 * 1024      # flush kern.log buffer at this size...
+FLUSH_INTERVAL = 0.5         # ...or after this many seconds
+STATS_INTERVAL = 60          # secs between throughput summaries
+BURST_PORTS_SHOWN = 32       # ports listed per [BURST] summary line
+COALESCE_WINDOW = float(os.environ.get("PORTSCAN_COALESCE_WINDOW", "0"))
 terminate = False
 
 def handler(signum, frame):
@@ -56,74 +64,264 @@ def handler(signum, frame):
     terminate = True
 
 def fake_mac():
-    return ":".join(f"{random.randint(0, 255):02x}" for _ in range(6))
+    return random.getrandbits(48).to_bytes(6, "big").hex(":")
 
-def write_iptables_log(line):
-    with open(KERNLOG_PATH, "a") as logf:
-        logf.write(line + "\n")
-        logf.flush()
+def parse_line(line):
+    """
+    (proto, src_ip, src_port, dst_ip, dst_port) for a tcpdump SYN/UDP line, else None.
+    """
+    match = RE_PKT.search(line)
+    if not match:
+        return None
+    src_ip, src_port, dst_ip, dst_port, syn = match.groups()
+    return ("TCP" if syn else "UDP"), src_ip, src_port, dst_ip, dst_port
 
-def main():
+class KernLogWriter:
+    """
+    Buffered appender for the simulated iptables log: one open/write per
+    batch instead of per packet.
+    """
+
+    def __init__(self, path=KERNLOG_PATH, flush_bytes=FLUSH_BYTES, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.lines_written = 0
+        self._buf = []
+        self._size = 0
+        self._since = 0.0
+
+    def write(self, line):
+        if not self._buf:
+            self._since = time.monotonic()
+        self._buf.append(line + "\n")
+        self._size += len(line) + 1
+        if self._size >= self.flush_bytes:
+            self.flush()
+
+    def flush_if_due(self):
+        if self._buf and time.monotonic() - self._since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._buf:
+            return
+        data = "".join(self._buf)
+        n = len(self._buf)
+        self._buf, self._size = [], 0
+        with open(self.path, "a") as logf:
+            logf.write(data)
+        self.lines_written += n
+
+class BurstCoalescer:
+    """
+    Per (source, protocol) burst tracking over fixed windows. Only the first
+    packet of a burst is logged; the rest are summarised (port set, count,
+    first/last seen) when the window closes.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.bursts = {}
+        self._closed = []
+
+    def admit(self, src_ip, proto, dst_port, now):
+        key = (src_ip, proto)
+        burst = self.bursts.get(key)
+        if burst is not None and now - burst["first"] >= self.window:
+            self._closed.append(self._summary(key, self.bursts.pop(key)))
+            burst = None
+        if burst is None:
+            self.bursts[key] = {"ports": {dst_port}, "count": 1, "first": now, "last": now}
+            return True
+        burst["ports"].add(dst_port)
+        burst["count"] += 1
+        burst["last"] = now
+        return False
+
+    def _summary(self, key, burst):
+        return {
+            "src": key[0],
+            "proto": key[1],
+            "ports": sorted(burst["ports"], key=int),
+            "count": burst["count"],
+            "first": burst["first"],
+            "last": burst["last"],
+        }
+
+    def expire(self, now, force=False):
+        done, self._closed = self._closed, []
+        for key, burst in list(self.bursts.items()):
+            if force or now - burst["first"] >= self.window:
+                done.append(self._summary(key, self.bursts.pop(key)))
+        return done
+
+class CapturePipeline:
+    """
+    tcpdump text lines in, simulated iptables kern.log lines out.
+    """
+
+    def __init__(self, writer, host_ip=HOST_IP, interface=INTERFACE, coalescer=None, verbose=False):
+        self.writer = writer
+        self.host_ip = host_ip
+        self.interface = interface
+        self.coalescer = coalescer
+        self.verbose = verbose
+        self.packets = 0
+        self.bursts = 0
+        self._lock = threading.Lock()
+        self._ts_sec = None
+        self._ts_str = ""
+
+    def _timestamp(self, now):
+        sec = int(now)
+        if sec != self._ts_sec:
+            self._ts_sec = sec
+            self._ts_str = time.strftime("%b %e %H:%M:%S", time.localtime(sec))
+        return self._ts_str
+
+    def feed(self, rawline):
+        pkt = parse_line(rawline)
+        if pkt is None:
+            return
+        proto, src_ip, src_port, dst_ip, dst_port = pkt
+        # Confirm dst_ip matches our IP
+        if dst_ip != self.host_ip:
+            return
+        if proto == "UDP" and is_broadcast_address(dst_ip):
+            return  # skip broadcast UDP events
+        now = time.time()
+        with self._lock:
+            self.packets += 1
+            if self.coalescer is not None and not self.coalescer.admit(src_ip, proto, dst_port, now):
+                return
+            timestamp = self._timestamp(now)
+            mac = fake_mac()
+            if proto == "TCP":
+                logline = (
+                    f"{timestamp} {HOSTNAME} kernel: canaryfw: "
+                    f"IN={self.interface} OUT= MAC={mac} "
+                    f"SRC={src_ip} DST={dst_ip} LEN=60 TOS=0x00 PREC=0x00 TTL=64 "
+                    f"ID={random.randrange(10000, 100000)} DF PROTO=TCP SPT={src_port} DPT={dst_port} WINDOW=29200 RES=0x00 SYN URGP=0"
+                )
+            else:
+                logline = (
+                    f"{timestamp} {HOSTNAME} kernel: IPTables-Dropped: "
+                    f"IN={self.interface} OUT= MAC={mac} "
+                    f"SRC={src_ip} DST={dst_ip} LEN=60 TOS=0x00 PREC=0x00 TTL=64 "
+                    f"ID={random.randrange(10000, 100000)} DF PROTO=UDP SPT={src_port} DPT={dst_port} LEN=42"
+                )
+            self.writer.write(logline)
+        if self.verbose:
+            print(f"[{proto}->LOG] {src_ip}:{src_port} -> {dst_ip}:{dst_port}")
+
+    def tick(self, force=False):
+        """
+        Flush due output and report finished bursts; call periodically.
+        """
+        with self._lock:
+            if force:
+                self.writer.flush()
+            else:
+                self.writer.flush_if_due()
+            done = self.coalescer.expire(time.time(), force) if self.coalescer is not None else []
+        self.bursts += len(done)
+        for burst in done:
+            ports = burst["ports"]
+            shown = ",".join(str(p) for p in ports[:BURST_PORTS_SHOWN])
+            if len(ports) > BURST_PORTS_SHOWN:
+                shown += f",... (+{len(ports) - BURST_PORTS_SHOWN} more)"
+            print(
+                f"[BURST] {burst['src']} {burst['proto']} {burst['count']} pkt(s) "
+                f"to {len(ports)} port(s) [{shown}] "
+                f"{time.strftime('%H:%M:%S', time.localtime(burst['first']))}-"
+                f"{time.strftime('%H:%M:%S', time.localtime(burst['last']))}"
+            )
+
+def ticker(pipeline, stop):
+    last_stats = time.monotonic()
+    last_packets = 0
+    while not stop.is_set():
+        stop.wait(0.1)
+        pipeline.tick()
+        if time.monotonic() - last_stats >= STATS_INTERVAL:
+            n = pipeline.packets
+            if n != last_packets:
+                print(f"[*] {n - last_packets} packet(s), {pipeline.writer.lines_written} line(s) written so far")
+            last_stats, last_packets = time.monotonic(), n
+
+def replay(trace_path, output_path, host_ip, coalesce_window):
+    """
+    Feed recorded tcpdump text through the pipeline and report throughput.
+    """
+    writer = KernLogWriter(output_path)
+    coalescer = BurstCoalescer(coalesce_window) if coalesce_window > 0 else None
+    pipeline = CapturePipeline(writer, host_ip=host_ip, coalescer=coalescer)
+    lines = 0
+    start = time.perf_counter()
+    with open(trace_path, "r", errors="replace") as f:
+        for line in f:
+            lines += 1
+            pipeline.feed(line)
+    pipeline.tick(force=True)
+    elapsed = time.perf_counter() - start
+    return {
+        "lines": lines,
+        "packets": pipeline.packets,
+        "written": writer.lines_written,
+        "bursts": pipeline.bursts,
+        "seconds": elapsed,
+        "packets_per_sec": pipeline.packets / elapsed if elapsed > 0 else 0.0,
+    }
+
+def main(coalesce_window=COALESCE_WINDOW, verbose=False):
     print(f"[*] Using detected interface: {INTERFACE}")
     print(f"[*] Detected host IP: {HOST_IP}")
     print(f"[*] Starting tcpdump... Simulating iptables logs to {KERNLOG_PATH}")
+    if coalesce_window > 0:
+        print(f"[*] Coalescing scan bursts per source over {coalesce_window}s")
 
-    while not terminate:
-        try:
-            with subprocess.Popen(
-                TCPDUMP_CMD, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
-            ) as proc:
-                for rawline in proc.stdout:
-                    if terminate:
-                        proc.terminate()
-                        break
-                    line = rawline.strip()
-                    now = time.localtime()
-                    timestamp = time.strftime("%b %e %H:%M:%S", now)
-
-                    match = RE_TCP.search(line)
-                    if match:
-                        src_ip, src_port, dst_ip, dst_port = match.groups()
-                        # Confirm dst_ip matches our IP
-                        if dst_ip != HOST_IP:
-                            continue
-                        mac = fake_mac()
-                        logline = (
-                            f"{timestamp} {HOSTNAME} kernel: canaryfw: "
-                            f"IN={INTERFACE} OUT= MAC={mac} "
-                            f"SRC={src_ip} DST={dst_ip} LEN=60 TOS=0x00 PREC=0x00 TTL=64 "
-                            f"ID={random.randint(10000,99999)} DF PROTO=TCP SPT={src_port} DPT={dst_port} WINDOW=29200 RES=0x00 SYN URGP=0"
-                        )
-                        write_iptables_log(logline)
-                        print(f"[TCP->LOG] {src_ip}:{src_port} -> {dst_ip}:{dst_port}")
-                        continue
-
-                    match = RE_UDP.search(line)
-                    if match:
-                        src_ip, src_port, dst_ip, dst_port = match.groups()
-                        # Confirm dst_ip matches our IP
-                        if dst_ip != HOST_IP:
-                            continue
-                        if is_broadcast_address(dst_ip):
-                            continue  # skip broadcast UDP events
-                        mac = fake_mac()
-                        logline = (
-                            f"{timestamp} {HOSTNAME} kernel: IPTables-Dropped: "
-                            f"IN={INTERFACE} OUT= MAC={mac} "
-                            f"SRC={src_ip} DST={dst_ip} LEN=60 TOS=0x00 PREC=0x00 TTL=64 "
-                            f"ID={random.randint(10000,99999)} DF PROTO=UDP SPT={src_port} DPT={dst_port} LEN=42"
-                        )
-                        write_iptables_log(logline)
-                        print(f"[UDP->LOG] {src_ip}:{src_port} -> {dst_ip}:{dst_port}")
-                        continue
-        except Exception as e:
-            print(f"[!] Exception in tcpdump loop: {e}. Restarting in 3s...")
-            time.sleep(3)
+    writer = KernLogWriter(KERNLOG_PATH)
+    coalescer = BurstCoalescer(coalesce_window) if coalesce_window > 0 else None
+    pipeline = CapturePipeline(writer, coalescer=coalescer, verbose=verbose)
+    stop = threading.Event()
+    threading.Thread(target=ticker, args=(pipeline, stop), daemon=True).start()
+
+    try:
+        while not terminate:
+            try:
+                with subprocess.Popen(
+                    TCPDUMP_CMD, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+                ) as proc:
+                    for rawline in proc.stdout:
+                        if terminate:
+                            proc.terminate()
+                            break
+                        pipeline.feed(rawline)
+            except Exception as e:
+                print(f"[!] Exception in tcpdump loop: {e}. Restarting in 3s...")
+                time.sleep(3)
+    finally:
+        stop.set()
+        pipeline.tick(force=True)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate iptables portscan logs from tcpdump")
+    parser.add_argument("--coalesce", type=float, default=COALESCE_WINDOW, metavar="SECS",
+                        help="log one line per source/protocol burst and summarise the rest (0 = off)")
+    parser.add_argument("--verbose", action="store_true", help="print every logged packet")
+    parser.add_argument("--replay", metavar="TRACE", help="read tcpdump text from a file instead of capturing")
+    parser.add_argument("--output", default=os.devnull, help="kern.log path for --replay")
+    parser.add_argument("--host-ip", default=HOST_IP, help="destination IP to accept for --replay")
+    args = parser.parse_args()
+
+    if args.replay:
+        print(json.dumps(replay(args.replay, args.output, args.host_ip, args.coalesce)))
+        sys.exit(0)
+
     signal.signal(signal.SIGTERM, handler)
     signal.signal(signal.SIGINT, handler)
     try:
-        main()
+        main(args.coalesce, args.verbose)
     except Exception as e:
         print(f"[!] Unhandled exception: {e}")
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+#
+# retention.py
+#
+# Keeps the hot OpenCanary log small and enforces logman.log_expiry:
+#   - lines from before today are moved out of the hot log into dated gzip
+#     segments (one per day) under ARCHIVE_DIR, each with a small time index
+#   - segments entirely older than log_expiry days are deleted whole
+#
+# The cut point in the hot log is found by binary search over line starts
+# using each line's local_time_adjusted/local_time, so only O(log n) lines
+# are parsed. iter_lines() reads a time range across segments + hot log.
+#
+# The hot log is never rewritten: writers keep appending to it. Dropped
+# lines are cut off logically (logstore.hot_start) and their disk blocks
+# are released by punching a hole, so offsets of retained lines never move.
+# Lines indexer.py has not read yet are left in the hot log until a later
+# pass (consumed_offset), so the index and rollups never miss them.
+#
+import os
+import json
+import gzip
+import time
+import ctypes
+import ctypes.util
+import signal
+import sqlite3
+import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from utils import get_setting, load_json, LOG_PATH, ARCHIVE_DIR, INDEX_FILE, ROLLUP_FILE
+from logstore import parse_time, hot_start, set_hot_start
+from logquery import IndexReader
+
+CHECK_INTERVAL = 3600     # secs between rotate/expire passes
+BLOCK_LINES    = 5000     # lines per gzip member (unit of the time index)
+SEGMENT_PREFIX = "opencanary-"
+SEGMENT_SUFFIX = ".log.gz"
+INDEX_SUFFIX   = ".idx"
+TS_FORMAT      = "%Y-%m-%d %H:%M:%S.%f"
+FALLOC_FL_KEEP_SIZE  = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
+terminate = False
+
+def handler(signum, frame):
+    global terminate
+    print("[*] Received signal to terminate. Exiting cleanly...")
+    terminate = True
+
+def now_str() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def line_time(raw: bytes) -> Optional[datetime.datetime]:
+    """
+    Timestamp of a JSON log line (local_time_adjusted, else local_time).
+    """
+    if not raw.lstrip().startswith(b"{"):
+        return None
+    try:
+        obj = json.loads(raw)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    if not isinstance(obj, dict):
+        return None
+    return parse_time(obj.get("local_time_adjusted")) or parse_time(obj.get("local_time"))
+
+# ——— Cut point search ——————————————————————————————————————————
+
+def _first_stamped_line(f, pos: int, size: int, start: int = 0) -> Tuple[Optional[int], Optional[datetime.datetime]]:
+    """
+    Start offset and time of the first timestamped line starting at or after
+    pos. `start` is a known line start (the hot log's first retained line).
+    """
+    f.seek(pos)
+    if pos > start:
+        f.seek(pos - 1)
+        if f.read(1) != b"\n":
+            f.readline()            # skip the partial line
+            pos = f.tell()
+    while pos < size:
+        raw = f.readline()
+        if not raw.endswith(b"\n"):
+            break                   # incomplete last line
+        ts = line_time(raw)
+        if ts is not None:
+            return pos, ts
+        pos += len(raw)
+    return None, None
+
+def find_cutoff(path: str, cutoff: datetime.datetime) -> int:
+    """
+    Byte offset of the first line whose time is >= cutoff (a line start),
+    searching from the hot log's retained start. Assumes the log is written
+    in time order; lines without a timestamp go with the line before them.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    size, first = st.st_size, hot_start(path, st)
+    with open(path, "rb") as f:
+        lo, hi = first, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, ts = _first_stamped_line(f, mid, size, first)
+            if start is None or ts >= cutoff:
+                hi = mid
+            else:
+                lo = start + 1
+        start, _ = _first_stamped_line(f, lo, size, first)
+        if start is None:
+            # Nothing newer: cut after the last complete line
+            if size <= first:
+                return first
+            f.seek(size - 1)
+            return size if f.read(1) == b"\n" else max(_last_line_start(f, size), first)
+        return start
+
+def _last_line_start(f, size: int) -> int:
+    step = 4096
+    pos = size
+    while pos > 0:
+        pos = max(0, pos - step)
+        f.seek(pos)
+        chunk = f.read(min(step, size - pos))
+        i = chunk.rfind(b"\n")
+        if i >= 0:
+            return pos + i + 1
+    return 0
+
+# ——— Segments ————————————————————————————————————————————————
+
+def segment_paths(archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """
+    Segment files, oldest first (names sort by their first timestamp).
+    """
+    try:
+        names = os.listdir(archive_dir)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(archive_dir, n) for n in sorted(names)
+        if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)
+    ]
+
+def load_index(segment: str) -> dict:
+    try:
+        with open(segment + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def segment_lines(segment: str, offset: int = 0) -> Iterator[bytes]:
+    """
+    Raw lines of one segment, from the gzip member starting at `offset`.
+    """
+    with open(segment, "rb") as raw_f:
+        raw_f.seek(offset)
+        with gzip.GzipFile(fileobj=raw_f, mode="rb") as gz:
+            yield from gz
+
+class SegmentWriter:
+    """
+    Write one gzip segment as a series of gzip members of BLOCK_LINES lines,
+    recording (first time, compressed offset) for each member in the index.
+    """
+
+    def __init__(self, archive_dir: str, first_ts: datetime.datetime):
+        name = SEGMENT_PREFIX + first_ts.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(archive_dir, name + SEGMENT_SUFFIX)
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(archive_dir, f"{name}-{n}{SEGMENT_SUFFIX}")
+            n += 1
+        self.path = path
+        self._tmp = path + ".tmp"
+        self._out = open(self._tmp, "wb")
+        self._block: List[bytes] = []
+        self._block_ts: Optional[datetime.datetime] = None
+        self.blocks: List[list] = []
+        self.first: Optional[datetime.datetime] = None
+        self.last: Optional[datetime.datetime] = None
+        self.lines = 0
+
+    def write(self, raw: bytes, ts: Optional[datetime.datetime]) -> None:
+        if ts is not None:
+            if self.first is None:
+                self.first = ts
+            if self.last is None or ts > self.last:
+                self.last = ts
+            if self._block_ts is None:
+                self._block_ts = ts
+        self._block.append(raw)
+        self.lines += 1
+        if len(self._block) >= BLOCK_LINES:
+            self._flush_block()
+
+    def _flush_block(self) -> None:
+        if not self._block:
+            return
+        ts = self._block_ts or self.last or self.first
+        self.blocks.append([ts.strftime(TS_FORMAT) if ts else None, self._out.tell()])
+        with gzip.GzipFile(fileobj=self._out, mode="wb", mtime=0) as gz:
+            gz.write(b"".join(self._block))
+        self._block, self._block_ts = [], None
+
+    def close(self) -> str:
+        self._flush_block()
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        self._out.close()
+        index = {
+            "first": self.first.strftime(TS_FORMAT) if self.first else None,
+            "last": self.last.strftime(TS_FORMAT) if self.last else None,
+            "lines": self.lines,
+            "blocks": self.blocks,
+        }
+        with open(self.path + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(self._tmp, self.path)
+        return self.path
+
+# ——— Rotate / expire ———————————————————————————————————————————
+
+def consumed_offset(log_path: str = LOG_PATH, index_path: str = INDEX_FILE,
+                    rollup_path: str = ROLLUP_FILE) -> int:
+    """
+    Hot-log offset (a line start) up to which indexer.py has folded lines
+    into both the index and the saved rollups; hot_start() if either has no
+    position for the file as it is now.
+    """
+    try:
+        st = os.stat(log_path)
+    except FileNotFoundError:
+        return 0
+    first = hot_start(log_path, st)
+    try:
+        reader = IndexReader(index_path)
+        try:
+            saved = reader.get_meta("inode", "offset")
+        finally:
+            reader.close()
+    except sqlite3.Error:
+        saved = {}
+    rolled = load_json(rollup_path)
+    offsets = [
+        int(saved["offset"]) if saved.get("inode") == str(st.st_ino) and saved.get("offset", "").isdigit() else first,
+        rolled["offset"] if rolled.get("inode") == st.st_ino and isinstance(rolled.get("offset"), int) else first,
+    ]
+    return max(first, min(offsets))
+
+def rotate(log_path: str = LOG_PATH, archive_dir: str = ARCHIVE_DIR,
+           before: Optional[datetime.datetime] = None,
+           index_path: Optional[str] = INDEX_FILE, rollup_path: Optional[str] = ROLLUP_FILE) -> int:
+    """
+    Move hot-log lines older than `before` (default: local midnight) into
+    one segment per day, then drop them from the hot log. Lines past
+    consumed_offset() stay for a later pass; index_path/rollup_path None
+    skips that check. Returns the number of bytes moved.
+    """
+    if before is None:
+        before = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    first = hot_start(log_path)
+    cut = find_cutoff(log_path, before)
+    if index_path is not None and rollup_path is not None:
+        consumed = consumed_offset(log_path, index_path, rollup_path)
+        if consumed < cut:
+            print(f"[{now_str()}] Keeping {cut - consumed} byte(s) indexer.py has not read yet for a later pass")
+            cut = consumed
+    if cut <= first:
+        return 0
+    os.makedirs(archive_dir, exist_ok=True)
+
+    writer: Optional[SegmentWriter] = None
+    day = None
+    leading: List[bytes] = []     # lines before the first timestamp
+    with open(log_path, "rb") as f:
+        f.seek(first)
+        pos = first
+        for raw in f:
+            if pos >= cut:
+                break
+            pos += len(raw)
+            ts = line_time(raw)
+            if ts is not None and ts.date() != day:
+                if writer is not None:
+                    writer.close()
+                writer = SegmentWriter(archive_dir, ts)
+                day = ts.date()
+                for lead in leading:
+                    writer.write(lead, None)
+                leading = []
+            if writer is None:
+                leading.append(raw)
+            else:
+                writer.write(raw, ts)
+    if leading:
+        writer = SegmentWriter(archive_dir, before - datetime.timedelta(seconds=1))
+        for lead in leading:
+            writer.write(lead, None)
+    if writer is not None:
+        writer.close()
+
+    _drop_head(log_path, cut)
+    return cut - first
+
+def _punch_hole(fd: int, length: int) -> bool:
+    """
+    Release the disk blocks of the first `length` bytes (reads return zeros,
+    size and offsets unchanged). False where fallocate can't punch holes.
+    """
+    try:
+        fallocate = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True).fallocate
+    except (OSError, AttributeError):
+        return False
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    return fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, 0, length) == 0
+
+def _drop_head(path: str, cut: int) -> None:
+    """
+    Drop the first `cut` bytes of a live log without moving anything: record
+    `cut` as the start readers begin at, then punch out the bytes before it.
+    Writers appending meanwhile are unaffected, so no line is lost or
+    reordered.
+    """
+    set_hot_start(path, cut)
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        if not _punch_hole(fd, cut):
+            print(f"[WARN] Could not punch a hole in {path} (errno {ctypes.get_errno()}); "
+                  f"old lines are skipped but still use disk space")
+    finally:
+        os.close(fd)
+
+def expire(days: float, archive_dir: str = ARCHIVE_DIR, now: Optional[datetime.datetime] = None) -> List[str]:
+    """
+    Delete segments whose newest line is older than `days`; whole files,
+    so the cost is one small index read per segment.
+    """
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(days=days)
+    removed = []
+    for seg in segment_paths(archive_dir):
+        last = parse_time(load_index(seg).get("last"))
+        if last is None:
+            # No timestamped lines: fall back to when the segment was written
+            try:
+                last = datetime.datetime.fromtimestamp(os.path.getmtime(seg))
+            except FileNotFoundError:
+                continue
+        if last >= cutoff:
+            continue
+        for p in (seg, seg + INDEX_SUFFIX):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        removed.append(seg)
+    return removed
+
+def prune_hot(days: float, log_path: str = LOG_PATH, now: Optional[datetime.datetime] = None) -> int:
+    """
+    Drop hot-log lines older than `days` without archiving them (used when
+    log_expiry is shorter than the rotation period).
+    """
+    now = now or datetime.datetime.now()
+    first = hot_start(log_path)
+    cut = find_cutoff(log_path, now - datetime.timedelta(days=days))
+    if cut <= first:
+        return 0
+    _drop_head(log_path, cut)
+    return cut - first
+
+# ——— Time-range reads ——————————————————————————————————————————
+
+def iter_lines(start: Optional[datetime.datetime] = None,
+               end: Optional[datetime.datetime] = None,
+               log_path: str = LOG_PATH,
+               archive_dir: str = ARCHIVE_DIR,
+               include_hot: bool = True) -> Iterator[bytes]:
+    """
+    Raw lines with start <= time < end (None = unbounded), oldest first,
+    from the archived segments followed by the hot log. Lines without a
+    timestamp are returned with the lines around them.
+    """
+    bounded = start is not None or end is not None
+    for seg in segment_paths(archive_dir):
+        idx = load_index(seg)
+        first, last = parse_time(idx.get("first")), parse_time(idx.get("last"))
+        if start is not None and last is not None and last < start:
+            continue
+        if end is not None and first is not None and first >= end:
+            return
+        offset = 0
+        if start is not None:
+            for block_ts, block_off in idx.get("blocks", []):
+                bts = parse_time(block_ts)
+                if bts is not None and bts <= start:
+                    offset = block_off
+                else:
+                    break
+        for raw in segment_lines(seg, offset):
+            ts = line_time(raw) if bounded else None
+            if ts is not None:
+                if start is not None and ts < start:
+                    continue
+                if end is not None and ts >= end:
+                    return
+            yield raw
+
+    if not include_hot:
+        return
+    pos = find_cutoff(log_path, start) if start is not None else hot_start(log_path)
+    try:
+        f = open(log_path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(pos)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            if end is not None:
+                ts = line_time(raw)
+                if ts is not None and ts >= end:
+                    return
+            yield raw
+
+# ——— Main loop ————————————————————————————————————————————————
+
+def run_once(log_path: str = LOG_PATH, archive_dir: str = ARCHIVE_DIR) -> None:
+    expiry = get_setting("logman.log_expiry", None)
+    try:
+        days = float(expiry)
+        if days <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        print(f"[{now_str()}] log_expiry not set or invalid ({expiry!r}); rotating only.")
+        days = None
+
+    moved = rotate(log_path, archive_dir)
+    if moved:
+        print(f"[{now_str()}] Rotated {moved} bytes into {archive_dir}")
+    if days is not None:
+        if days < 1:
+            prune_hot(days, log_path)
+        for seg in expire(days, archive_dir):
+            print(f"[{now_str()}] Removed expired segment {os.path.basename(seg)}")
+
+def main():
+    while not terminate:
+        try:
+            run_once()
+        except Exception as e:
+            print(f"[!] Retention pass failed: {e}")
+        deadline = time.monotonic() + CHECK_INTERVAL
+        while not terminate and time.monotonic() < deadline:
+            time.sleep(1)
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    main()
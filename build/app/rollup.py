@@ -0,0 +1,248 @@
+import os
+import time
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils import load_json, save_json, get_setting, ROLLUP_FILE, NODE_ROLLUP_FILE
+from logstore import LogCache, LogEvent
+
+# Bucket width (seconds) -> how long buckets of that width are kept (seconds).
+# Every event is counted at all resolutions; fine buckets simply age out first.
+RESOLUTIONS = {
+    60:    1 * 86400,
+    300:   7 * 86400,
+    3600:  90 * 86400,
+    86400: 1100 * 86400,
+}
+# Widths whose keys keep src_host. The chart never groups by source, so the
+# coarser (longer kept) tiers drop it and grow with buckets, not sources.
+HOST_RESOLUTIONS = {60}
+# Dashboard chart window label -> (window secs, bucket width secs from RESOLUTIONS)
+CHART_WINDOWS = {
+    "1 hour":   (3600,       60),
+    "6 hours":  (6 * 3600,   300),
+    "24 hours": (24 * 3600,  300),
+    "7 days":   (7 * 86400,  3600),
+    "30 days":  (30 * 86400, 86400),
+}
+SAVE_INTERVAL = 30   # secs between persisting the store to disk
+
+Key = Tuple[str, str, str]   # (logtype, src_host, node_id)
+
+def _key_str(key: Key) -> str:
+    return "\t".join(key)
+
+def _key_tuple(s: str) -> Key:
+    parts = s.split("\t")
+    parts += [""] * (3 - len(parts))
+    return parts[0], parts[1], parts[2]
+
+class RollupStore:
+    """
+    Event counts per time bucket, broken down by (logtype, src_host, node_id),
+    at every width in RESOLUTIONS. Fed incrementally by a LogCache and saved
+    with the log inode/offset it has folded up to, so a restart does not
+    count the same lines twice.
+    """
+
+    def __init__(self, path: str = ROLLUP_FILE, save_interval: float = SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self.buckets: Dict[int, Dict[int, Dict[Key, int]]] = {res: {} for res in RESOLUTIONS}
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.high_water = 0.0     # newest event time (epoch) folded in so far
+        self._resync = False      # after a reset, skip lines already counted
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._saving = False
+        self._lock = threading.Lock()
+        self.load()
+
+    # ─── Persistence ────────────────────────────────────────────────────────────
+    def load(self) -> None:
+        data = load_json(self.path)
+        if not data:
+            return
+        for res_s, buckets in data.get("buckets", {}).items():
+            res = int(res_s)
+            if res not in RESOLUTIONS:
+                continue
+            loaded = self.buckets[res] = {}
+            for b, counts in buckets.items():
+                merged = loaded[int(b)] = {}
+                for k, n in counts.items():
+                    key = _key_tuple(k)
+                    if res not in HOST_RESOLUTIONS:
+                        key = (key[0], "", key[2])   # saved before hosts were dropped
+                    merged[key] = merged.get(key, 0) + int(n)
+        self.inode = data.get("inode")
+        self.offset = int(data.get("offset", 0))
+        self.high_water = float(data.get("high_water", 0.0))
+
+    def save(self) -> None:
+        with self._lock:
+            self._compact(time.time())
+            data = {
+                "inode": self.inode,
+                "offset": self.offset,
+                "high_water": self.high_water,
+                "buckets": {
+                    str(res): {
+                        str(b): {_key_str(k): n for k, n in counts.items()}
+                        for b, counts in buckets.items()
+                    }
+                    for res, buckets in self.buckets.items()
+                },
+            }
+            self._dirty = False
+            self._last_save = time.monotonic()
+        try:
+            save_json(self.path, data, indent=None)
+        except OSError:
+            pass
+
+    def save_if_due(self) -> None:
+        """
+        Save in a background thread when due, so a Streamlit render never
+        waits on serializing the store.
+        """
+        if self._saving or not self._dirty or time.monotonic() - self._last_save < self.save_interval:
+            return
+        self._saving = True
+        threading.Thread(target=self._save_background, daemon=True).start()
+
+    def _save_background(self) -> None:
+        try:
+            self.save()
+        finally:
+            self._saving = False
+
+    def _compact(self, now: float) -> None:
+        # Drop buckets past their resolution's keep time, and anything older
+        # than the log retention so the chart never shows pruned history.
+        expiry_days = get_setting("logman.log_expiry", None)
+        try:
+            retained = float(expiry_days) * 86400 if expiry_days else None
+        except (TypeError, ValueError):
+            retained = None
+        for res, keep in RESOLUTIONS.items():
+            if retained is not None:
+                keep = min(keep, retained)
+            cutoff = now - keep
+            buckets = self.buckets[res]
+            for b in [b for b in buckets if b + res <= cutoff]:
+                del buckets[b]
+
+    # ─── Ingestion ──────────────────────────────────────────────────────────────
+    def attach(self, cache: LogCache) -> None:
+        follower = cache.follower
+
+        def on_events(new: List[LogEvent], reset: bool) -> None:
+            self.add(new, follower.inode, follower.offset, reset)
+
+        cache.listeners.append(on_events)
+
+    def add(self, events: Iterable[LogEvent], inode: Optional[int] = None,
+            offset: Optional[int] = None, reset: bool = False) -> None:
+        """
+        Count events. Given the log position they were read up to (attach()
+        passes it), that position is recorded in the same critical section
+        as the counts, so a concurrent save never pairs one with the other's
+        previous value.
+        """
+        with self._lock:
+            if inode is not None and (reset or (self.inode is not None and inode != self.inode)):
+                self.offset = 0
+                self._resync = True
+            for ev in events:
+                if ev.offset < self.offset or ev.ts is None:
+                    continue
+                epoch = ev.ts.timestamp()
+                if self._resync:
+                    if epoch <= self.high_water:
+                        continue
+                    self._resync = False
+                key = (str(ev.logtype), ev.src_host, ev.node_id)
+                short = (key[0], "", key[2])
+                for res, buckets in self.buckets.items():
+                    k = key if res in HOST_RESOLUTIONS else short
+                    counts = buckets.setdefault(int(epoch // res) * res, {})
+                    counts[k] = counts.get(k, 0) + 1
+                if epoch > self.high_water:
+                    self.high_water = epoch
+                self._dirty = True
+            if inode is not None:
+                self.inode = inode
+                self.offset = max(self.offset, offset)
+                self._dirty = True
+
+    # ─── Queries ────────────────────────────────────────────────────────────────
+    def series(
+        self,
+        window: int,
+        res: int,
+        include_logtypes: Optional[List[str]] = None,
+        exclude_logtypes: Optional[List[str]] = None,
+        group_by: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> List[Tuple[int, str, int]]:
+        """
+        Rows of (bucket_start, group, count) for every bucket in the last
+        `window` seconds, zero-filled. group_by is None, "logtype",
+        "src_host" or "node_id"; src_host is only kept at HOST_RESOLUTIONS
+        widths (coarser buckets group it all under "").
+        """
+        now = time.time() if now is None else now
+        first = int((now - window) // res) * res
+        last = int(now // res) * res
+        field = {"logtype": 0, "src_host": 1, "node_id": 2}.get(group_by or "")
+        totals: Dict[Tuple[int, str], int] = {}
+        groups = set()
+        with self._lock:
+            buckets = self.buckets[res]
+            for b in range(first, last + res, res):
+                counts = buckets.get(b)
+                if not counts:
+                    continue
+                for key, n in counts.items():
+                    if include_logtypes and key[0] not in include_logtypes:
+                        continue
+                    if exclude_logtypes and key[0] in exclude_logtypes:
+                        continue
+                    g = key[field] if field is not None else ""
+                    groups.add(g)
+                    totals[(b, g)] = totals.get((b, g), 0) + n
+        groups = sorted(groups) or [""]
+        return [
+            (b, g, totals.get((b, g), 0))
+            for b in range(first, last + res, res)
+            for g in groups
+        ]
+
+_readers: Dict[str, Tuple[Optional[int], RollupStore]] = {}
+_readers_lock = threading.Lock()
+
+def _reader(path: str) -> RollupStore:
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    with _readers_lock:
+        cached = _readers.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _readers[path] = (mtime, RollupStore(path))
+        return cached[1]
+
+def get_rollups() -> RollupStore:
+    """
+    This node's rollups as indexer.py last saved them, reloaded whenever it
+    has saved a newer copy. Read-only: never save it from the UI.
+    """
+    return _reader(ROLLUP_FILE)
+
+def get_node_rollups() -> RollupStore:
+    """
+    The aggregator's rollups (all nodes), reloaded the same way.
+    """
+    return _reader(NODE_ROLLUP_FILE)
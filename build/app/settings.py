@@ -1,11 +1,36 @@
 # settings.py
 import time
 import os
-import shutil
+import functools
 import zipfile
-import datetime
 import streamlit as st
-from utils import load_settings, save_settings, BACKUP_DIR, CONFIG_PATH, restart_opencanary
+from utils import load_settings, save_settings, BACKUP_DIR, restart_opencanary
+from logstore import hot_start, clear_hot_start
+from backup import (
+    list_backups, start_backup, current_job, job_running,
+    export_backup, restore_backup, prune_blobs
+)
+
+@st.fragment(run_every=1)
+def backup_progress():
+    # Only rendered while a job runs, so nothing polls once it is done
+    job = current_job()
+    if job is not None and not job.finished:
+        st.progress(job.done / job.total if job.total else 0.0,
+                    text=f"Creating {job.name}: {job.done}/{job.total} files")
+    else:
+        # Finished: refresh the backup list and show the result
+        st.rerun(scope="app")
+
+def backup_result():
+    job = current_job()
+    if job is None:
+        return
+    if job.error:
+        st.error(f"Backup failed: {job.error}")
+    else:
+        st.success(f"Created backup: {job.name} "
+                   f"({job.stats['stored']} skin file(s) stored, {job.stats['reused']} reused)")
 
 def render_settings():
     settings = load_settings()
@@ -56,98 +81,49 @@ def render_settings():
     # ─── Backup management ─────────────────────────────────────────────────────
     os.makedirs(BACKUP_DIR, exist_ok=True)
 
-    APP_DIR_TARGET_FILES = {"settings.conf", "rsyslog-opencanary.conf"}
-
     col1, col2 = st.columns([3,1])
     with col2:
-        if st.button("Backup", use_container_width=True):
-            ts = datetime.datetime.now().strftime("%Y%m%d-%H%M")
-            backup_name = f"backup-{ts}.zip"
-            backup_path = os.path.join(BACKUP_DIR, backup_name)
-            with zipfile.ZipFile(backup_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                # add only the two target files under "app/"
-                for root, dirs, files in os.walk("/app"):
-                    if BACKUP_DIR in root:
-                        continue
-                    dirs[:] = [d for d in dirs if d not in ("__pycache__",) and not d.startswith(".")]
-                    for f in files:
-                        if f.startswith(".") or f not in APP_DIR_TARGET_FILES:
-                            continue
-                        full = os.path.join(root, f)
-                        rel  = os.path.relpath(full, "/app")
-                        arc  = os.path.join("app", rel)
-                        zf.write(full, arc)
-
-                # add opencanary config under "config/"
-                zf.write(CONFIG_PATH, os.path.join("config", os.path.basename(CONFIG_PATH)))
-
-                # add skins directory under "skins/"
-                skin_dir = "/usr/local/lib/python3.10/dist-packages/opencanary/modules/data/http/skin"
-                for root, dirs, files in os.walk(skin_dir):
-                    dirs[:] = [d for d in dirs if d != "__pycache__"]
-                    for f in files:
-                        full = os.path.join(root, f)
-                        rel  = os.path.relpath(full, skin_dir)
-                        arc  = os.path.join("skins", rel)
-                        zf.write(full, arc)
-
-            st.success(f"Created backup: {backup_name}")
-            time.sleep(2)
+        if st.button("Backup", use_container_width=True, disabled=job_running()):
+            start_backup()
             st.rerun()
+    with col1:
+        if job_running():
+            backup_progress()
+        else:
+            backup_result()
 
     with st.expander("Manage backups", expanded=False):
-        backups = sorted(
-            [f for f in os.listdir(BACKUP_DIR) if f.endswith(".zip")],
-            reverse=True
-        )
-        for name in backups:
+        for name in list_backups():
             col_name, col_dl, col_rs, col_del = st.columns([5,1,1,1])
             path = os.path.join(BACKUP_DIR, name)
             with col_name:
                 st.write(name)
-            # Download
+            # Download (skins expanded inline only when clicked)
             with col_dl:
-                with open(path, "rb") as f:
-                    st.download_button(
-                        label="⬇️",
-                        data=f,
-                        file_name=name,
-                        mime="application/zip",
-                        key=f"dl_{name}"
-                    )
+                st.download_button(
+                    label="⬇️",
+                    data=functools.partial(export_backup, path),
+                    file_name=name,
+                    mime="application/zip",
+                    key=f"dl_{name}"
+                )
             # Restore
             with col_rs:
                 if st.button("⟳", key=f"rs_{name}", help=f"Restore backup '{name}'"):
-                    with zipfile.ZipFile(path, "r") as zf:
-                        for member in zf.namelist():
-                            if member.startswith("backups/"):
-                                continue
-                            data = zf.read(member)
-                            # map to correct target
-                            if member.startswith("config/"):
-                                dest = CONFIG_PATH
-                            elif member.startswith("skins/"):
-                                rel = member[len("skins/"):]
-                                dest = os.path.join(
-                                    "/usr/local/lib/python3.10/dist-packages/opencanary/modules/data/http/skin",
-                                    rel
-                                )
-                            elif member.startswith("app/"):
-                                rel = member[len("app/"):]
-                                dest = os.path.join("/app", rel)
-                            else:
-                                continue
-                            os.makedirs(os.path.dirname(dest), exist_ok=True)
-                            with open(dest, "wb") as out:
-                                out.write(data)
-                    restart_opencanary()
-                    st.success(f"Restored from {name}")
-                    time.sleep(2)
-                    st.rerun()
+                    try:
+                        restore_backup(path)
+                    except (FileNotFoundError, zipfile.BadZipFile) as e:
+                        st.error(f"Cannot restore {name}: {e}")
+                    else:
+                        restart_opencanary()
+                        st.success(f"Restored from {name}")
+                        time.sleep(2)
+                        st.rerun()
             # Delete
             with col_del:
                 if st.button("❌", key=f"del_{name}", help=f"Delete backup '{name}'"):
                     os.remove(path)
+                    prune_blobs()
                     st.success(f"Deleted backup: {name}")
                     time.sleep(2)
                     st.rerun()
@@ -179,8 +155,9 @@ def render_settings():
 
     with st.expander("Opencanary log file", expanded=False):
         try:
-            with open(LOG_PATH, "r", encoding="utf-8", errors="replace") as f:
-                log_content = f.read()
+            with open(LOG_PATH, "rb") as f:
+                f.seek(hot_start(LOG_PATH))     # lines before it were archived/pruned
+                log_content = f.read().decode("utf-8", "replace")
         except FileNotFoundError:
             log_content = ""
             st.warning("Log file not found.")
@@ -197,6 +174,7 @@ def render_settings():
                 try:
                     with open(LOG_PATH, "w", encoding="utf-8") as f:
                         f.write(log_new)
+                    clear_hot_start(LOG_PATH)
                     st.success("Log file saved.")
                     time.sleep(1)
                     st.rerun()
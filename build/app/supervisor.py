@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+#
+# supervisor.py
+#
+# Starts and watches the container's background services and publishes a
+# status snapshot for the dashboard (no pgrep needed there):
+#   opencanary  - opencanaryd (twistd daemon, tracked through its pidfile)
+#   rsyslog     - rsyslogd -n, only while /app/rsyslog-opencanary.conf exists
+#   alerting    - alerting.py
+#   retention   - retention.py
+#   indexer     - indexer.py (feeds the dashboard's index and rollups)
+#   portscan    - portscanmod.py, only while portscan.enabled is true
+#   aggregator  - aggregator.py, only while settings.conf aggregator.enabled
+#                 is true; restarted when that block changes
+#
+# Config files are watched with inotify (falling back to mtime polling);
+# opencanaryd is restarted when its config changes or when the UI drops a
+# request file via request_restart(), and is reported ready once its
+# configured TCP ports accept connections.
+#
+import os
+import sys
+import time
+import shutil
+import signal
+import select
+import socket
+import struct
+import ctypes
+import ctypes.util
+import subprocess
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils import load_json, save_json, CONFIG_PATH, SETTINGS_FILE, SUPERVISOR_DIR, SUPERVISOR_STATUS
+
+APP_DIR           = os.path.dirname(os.path.abspath(__file__))
+OPENCANARY_PID    = "/var/run/opencanaryd.pid"
+RSYSLOG_CONF      = "/app/rsyslog-opencanary.conf"
+RSYSLOG_INSTALLED = "/etc/rsyslog.d/opencanary.conf"
+RESTART_REQUEST   = os.path.join(SUPERVISOR_DIR, "restart-opencanary")
+TICK              = 1.0      # secs between health checks
+STATUS_INTERVAL   = 2.0      # secs between status snapshots
+DEBOUNCE          = 1.0      # secs to coalesce bursts of file events
+LAUNCH_GRACE      = 10.0     # secs for a daemonizing launcher to write its pidfile
+READY_TIMEOUT     = 30.0     # secs to wait for opencanaryd's ports
+BACKOFF_MAX       = 60.0
+# OpenCanary modules that listen on UDP only; they can't be connect()-checked
+UDP_MODULES       = {"ntp", "snmp", "tftp", "sip", "llmnr", "portscan"}
+
+terminate = False
+
+def handler(signum, frame):
+    global terminate
+    print("[*] Received signal to terminate. Exiting cleanly...")
+    terminate = True
+
+def now_str() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+# ——— /proc helpers ————————————————————————————————————————————
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            state = f.read().rsplit(b")", 1)[1].split()[0]
+        return state != b"Z"
+    except (FileNotFoundError, IndexError, ProcessLookupError):
+        return False
+
+def proc_cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode("utf-8", "replace")
+    except FileNotFoundError:
+        return ""
+
+def proc_usage(pid: int):
+    """
+    (cpu ticks used so far, rss bytes) for a pid, or None.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            rss_pages = int(f.read().split()[1])
+    except (FileNotFoundError, IndexError, ValueError):
+        return None
+    # fields[0] is state (field 3); utime/stime are fields 14/15
+    return int(fields[11]) + int(fields[12]), rss_pages * PAGE_SIZE
+
+# ——— File change notifications ——————————————————————————————————
+
+IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x002, 0x004, 0x008
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x040, 0x080, 0x100, 0x200
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB
+IN_NONBLOCK, IN_CLOEXEC = os.O_NONBLOCK, 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+class FileWatcher:
+    """
+    Report which watched files changed. Uses inotify on their directories
+    (atomic replaces show up as IN_MOVED_TO); if inotify is unavailable,
+    compares mtimes every wait().
+    """
+
+    def __init__(self, paths: List[str]):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.fd = -1
+        self._wds: Dict[int, str] = {}
+        self._mtimes = {p: self._mtime(p) for p in self.paths}
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1")
+            for d in sorted({os.path.dirname(p) for p in self.paths}):
+                os.makedirs(d, exist_ok=True)
+                wd = libc.inotify_add_watch(fd, d.encode(), WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch {d}")
+                self._wds[wd] = d
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            print(f"[WARN] inotify unavailable ({e}); polling config files instead")
+
+    @staticmethod
+    def _mtime(path: str):
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except FileNotFoundError:
+            return None
+
+    def wait(self, timeout: float) -> set:
+        if self.fd < 0:
+            time.sleep(timeout)
+            changed = set()
+            for p in self.paths:
+                m = self._mtime(p)
+                if m != self._mtimes[p]:
+                    self._mtimes[p] = m
+                    changed.add(p)
+            return changed
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b"\0").decode("utf-8", "replace")
+            pos += length
+            path = os.path.join(self._wds.get(wd, ""), name)
+            if path in self.paths:
+                changed.add(path)
+        return changed
+
+# ——— Managed children ——————————————————————————————————————————
+
+class Child:
+    """
+    One managed service. Tracked through its Popen handle, or through a
+    pidfile for daemons that fork away (opencanaryd via twistd). A pidfile
+    PID only counts if that process's cmdline contains every string in
+    `cmdline_has`: after a container restart the stale file may name a PID
+    now reused by something else.
+    """
+
+    def __init__(self, name: str, cmd: List[str], enabled: Callable[[], bool] = lambda: True,
+                 pidfile: Optional[str] = None, cmdline_has: Tuple[str, ...] = (),
+                 log_path: str = os.devnull,
+                 before_start: Optional[Callable[[], None]] = None,
+                 after_stop: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.cmd = cmd
+        self.enabled = enabled
+        self.pidfile = pidfile
+        self.cmdline_has = cmdline_has
+        self.log_path = log_path
+        self.before_start = before_start
+        self.after_stop = after_stop
+        self.proc: Optional[subprocess.Popen] = None
+        self.started: Optional[float] = None
+        self.restarts = 0
+        self.last_exit: Optional[int] = None
+        self.ready: Optional[bool] = None
+        self.backoff = 1.0
+        self.next_start = 0.0
+        self._cpu = None    # (ticks, monotonic) at the last sample
+        self.cpu_pct = 0.0
+        self.rss = 0
+
+    @property
+    def pid(self) -> Optional[int]:
+        if self.pidfile:
+            try:
+                with open(self.pidfile) as f:
+                    pid = int(f.read().strip() or 0)
+            except (FileNotFoundError, ValueError):
+                pid = 0
+            if pid and pid_alive(pid) and all(s in proc_cmdline(pid) for s in self.cmdline_has):
+                return pid
+            return None
+        if self.proc is not None and self.proc.poll() is None:
+            return self.proc.pid
+        return None
+
+    def alive(self) -> bool:
+        return self.pid is not None
+
+    def reap(self) -> None:
+        # Collect exit codes of Popen children (including daemon launchers)
+        if self.proc is not None and self.proc.poll() is not None:
+            if not self.pidfile or self.proc.returncode != 0:
+                self.last_exit = self.proc.returncode
+            self.proc = None
+
+    def start(self) -> None:
+        if self.pidfile:
+            # Not ours if we got here (see pid); twistd refuses to start over it
+            try:
+                os.remove(self.pidfile)
+            except FileNotFoundError:
+                pass
+        if self.before_start:
+            self.before_start()
+        print(f"[{now_str()}] Starting {self.name}: {' '.join(self.cmd)}")
+        log = open(self.log_path, "ab")
+        try:
+            self.proc = subprocess.Popen(self.cmd, stdout=log, stderr=subprocess.STDOUT,
+                                         stdin=subprocess.DEVNULL, cwd=APP_DIR)
+        finally:
+            log.close()
+        self.started = time.time()
+        self.ready = None
+        self._cpu = None
+
+    def stop(self, timeout: float = 10.0) -> None:
+        pid = self.pid
+        if pid:
+            print(f"[{now_str()}] Stopping {self.name} (pid {pid})")
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline and pid_alive(pid):
+                if self.proc is not None and self.proc.pid == pid:
+                    self.proc.poll()
+                time.sleep(0.05)
+            if pid_alive(pid):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        if self.proc is not None:
+            try:
+                self.proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                pass
+            self.last_exit = self.proc.returncode
+            self.proc = None
+        self.started = None
+        self.ready = None
+        if self.after_stop:
+            self.after_stop()
+
+    def restart(self) -> None:
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def sample(self) -> None:
+        pid = self.pid
+        usage = proc_usage(pid) if pid else None
+        if usage is None:
+            self.cpu_pct, self.rss, self._cpu = 0.0, 0, None
+            return
+        ticks, self.rss = usage
+        now = time.monotonic()
+        if self._cpu is not None and now > self._cpu[1]:
+            self.cpu_pct = 100.0 * (ticks - self._cpu[0]) / CLK_TCK / (now - self._cpu[1])
+        self._cpu = (ticks, now)
+
+    def status(self) -> dict:
+        pid = self.pid
+        return {
+            "enabled": self.enabled(),
+            "up": pid is not None,
+            "pid": pid,
+            "started": self.started,
+            "uptime": (time.time() - self.started) if pid and self.started else 0,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "ready": self.ready,
+            "rss": self.rss,
+            "cpu": round(self.cpu_pct, 1),
+        }
+
+# ——— OpenCanary helpers ————————————————————————————————————————
+
+def opencanary_tcp_ports(path: str = CONFIG_PATH) -> List[int]:
+    cfg = load_json(path)
+    ports = []
+    for key, val in cfg.items():
+        if not key.endswith(".enabled") or val is not True:
+            continue
+        module = key[:-len(".enabled")]
+        if module in UDP_MODULES:
+            continue
+        port = cfg.get(f"{module}.port")
+        if isinstance(port, int) and port > 0:
+            ports.append(port)
+    return sorted(set(ports))
+
+def ports_accepting(ports: List[int]) -> bool:
+    for port in ports:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                pass
+        except OSError:
+            return False
+    return True
+
+def install_rsyslog_conf() -> None:
+    shutil.copyfile(RSYSLOG_CONF, RSYSLOG_INSTALLED)
+
+def remove_rsyslog_conf() -> None:
+    try:
+        os.remove(RSYSLOG_INSTALLED)
+    except FileNotFoundError:
+        pass
+
+# ——— Supervisor ————————————————————————————————————————————————
+
+class Supervisor:
+    def __init__(self):
+        py = sys.executable or "python3"
+        self.opencanary = Child("opencanary", ["opencanaryd", "--start"], pidfile=OPENCANARY_PID,
+                                cmdline_has=("twistd", "opencanary"))
+        self.children: Dict[str, Child] = {
+            "opencanary": self.opencanary,
+            "rsyslog": Child("rsyslog", ["rsyslogd", "-n"],
+                             enabled=lambda: self.rsyslog_on,
+                             before_start=install_rsyslog_conf, after_stop=remove_rsyslog_conf),
+            "alerting": Child("alerting", [py, os.path.join(APP_DIR, "alerting.py")]),
+            "retention": Child("retention", [py, os.path.join(APP_DIR, "retention.py")]),
+            "indexer": Child("indexer", [py, os.path.join(APP_DIR, "indexer.py")]),
+            "portscan": Child("portscan", [py, os.path.join(APP_DIR, "portscanmod.py")],
+                              enabled=lambda: self.portscan_on, log_path="/tmp/portscanmod.log"),
+            "aggregator": Child("aggregator", [py, os.path.join(APP_DIR, "aggregator.py")],
+                                enabled=lambda: self.aggregator_on, log_path="/tmp/aggregator.log"),
+        }
+        self.watcher = FileWatcher([CONFIG_PATH, SETTINGS_FILE, RSYSLOG_CONF, RESTART_REQUEST])
+        self.rsyslog_on = False
+        self.portscan_on = False
+        self.aggregator_on = False
+        self.aggregator_cfg: Optional[dict] = None
+        self.load_flags()
+        self.ready_deadline = 0.0
+        self.ready_ports: List[int] = []
+        self.pending: set = set()
+        self.pending_since = 0.0
+        self.last_status = 0.0
+
+    def load_flags(self) -> None:
+        # Only re-read on file change notifications, not every tick
+        self.rsyslog_on = os.path.exists(RSYSLOG_CONF)
+        self.portscan_on = load_json(CONFIG_PATH).get("portscan.enabled") is True
+        cfg = load_json(SETTINGS_FILE).get("aggregator")
+        self.aggregator_on = isinstance(cfg, dict) and cfg.get("enabled") is True
+        if cfg != self.aggregator_cfg:
+            # settings.conf changes for many reasons; only a new aggregator block restarts it
+            if self.aggregator_cfg is not None and self.children["aggregator"].alive():
+                self.children["aggregator"].stop()
+            self.aggregator_cfg = cfg
+
+    def restart_opencanary(self, reason: str) -> None:
+        print(f"[{now_str()}] Restarting opencanary ({reason})")
+        self.opencanary.restart()
+        self._await_ready()
+
+    def _await_ready(self) -> None:
+        self.ready_ports = opencanary_tcp_ports()
+        self.ready_deadline = time.monotonic() + READY_TIMEOUT
+        self.opencanary.ready = None
+
+    def handle_changes(self, changed: set) -> None:
+        self.load_flags()
+        requested = False
+        if RESTART_REQUEST in changed:
+            # Deleting the request fires another event; only a present file counts
+            try:
+                os.remove(RESTART_REQUEST)
+                requested = True
+            except FileNotFoundError:
+                pass
+        if requested or CONFIG_PATH in changed:
+            self.restart_opencanary("config changed" if CONFIG_PATH in changed else "requested")
+        if RSYSLOG_CONF in changed:
+            rs = self.children["rsyslog"]
+            if rs.alive():
+                rs.stop()
+            # started again below by check_children() if the file still exists
+
+    def check_children(self) -> None:
+        now = time.monotonic()
+        for child in self.children.values():
+            child.reap()
+            enabled = child.enabled()
+            alive = child.alive()
+            launching = (child.pidfile is not None and child.started is not None
+                         and (child.proc is not None or time.time() - child.started < LAUNCH_GRACE))
+            if enabled and not alive and not launching:
+                if now < child.next_start:
+                    continue
+                if child.started is not None:
+                    # It was running and died: restart with backoff
+                    print(f"[{now_str()}] {child.name} exited (code {child.last_exit}); restarting")
+                    child.restarts += 1
+                    child.next_start = now + child.backoff
+                    child.backoff = min(child.backoff * 2, BACKOFF_MAX)
+                child.start()
+                if child is self.opencanary:
+                    self._await_ready()
+            elif not enabled and alive:
+                child.stop()
+            elif alive and child.started and time.time() - child.started > BACKOFF_MAX:
+                child.backoff = 1.0
+            elif alive and child.started is None:
+                child.started = time.time()     # adopted an already running daemon
+
+        oc = self.opencanary
+        if oc.ready is None and self.ready_deadline:
+            if oc.alive() and ports_accepting(self.ready_ports):
+                oc.ready = True
+                print(f"[{now_str()}] opencanary ready on ports {self.ready_ports}")
+            elif now > self.ready_deadline:
+                oc.ready = False
+                print(f"[WARN] opencanary not accepting on {self.ready_ports} after {READY_TIMEOUT:.0f}s")
+
+    def write_status(self) -> None:
+        for child in self.children.values():
+            child.sample()
+        snapshot = {
+            "updated": time.time(),
+            "pid": os.getpid(),
+            "services": {name: child.status() for name, child in self.children.items()},
+        }
+        try:
+            save_json(SUPERVISOR_STATUS, snapshot, indent=None)
+        except OSError as e:
+            print(f"[WARN] Could not write {SUPERVISOR_STATUS}: {e}")
+
+    def run(self) -> None:
+        os.makedirs(SUPERVISOR_DIR, exist_ok=True)
+        while not terminate:
+            self.check_children()
+            if time.monotonic() - self.last_status >= STATUS_INTERVAL:
+                self.write_status()
+                self.last_status = time.monotonic()
+
+            changed = self.watcher.wait(TICK)
+            if changed:
+                if not self.pending:
+                    self.pending_since = time.monotonic()
+                self.pending |= changed
+            if self.pending and time.monotonic() - self.pending_since >= DEBOUNCE:
+                changed, self.pending = self.pending, set()
+                self.handle_changes(changed)
+
+        for child in self.children.values():
+            child.stop()
+        try:
+            os.remove(SUPERVISOR_STATUS)
+        except FileNotFoundError:
+            pass
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    try:
+        Supervisor().run()
+    except Exception as e:
+        print(f"[!] Unhandled exception: {e}")
+        raise
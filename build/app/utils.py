@@ -8,6 +8,17 @@ CONFIG_PATH    = "/etc/opencanaryd/opencanary.conf"
 LOG_PATH       = "/var/tmp/opencanary.log"
 BACKUP_DIR     = "/app/backups"
 SETTINGS_FILE  = "/app/settings.conf"
+ROLLUP_FILE    = "/app/rollups.json"
+ARCHIVE_DIR    = "/var/tmp/opencanary-archive"
+INDEX_FILE     = "/var/tmp/opencanary-index.db"
+SKIN_DIR       = "/usr/local/lib/python3.10/dist-packages/opencanary/modules/data/http/skin"
+NODE_DIR         = "/var/tmp/opencanary-nodes"        # aggregator: per-node partitions
+NODE_INDEX_FILE  = "/var/tmp/opencanary-nodes.db"
+NODE_ROLLUP_FILE = "/app/rollups-nodes.json"
+NODE_STATUS      = "/var/tmp/opencanary-nodes.json"
+SUPERVISOR_DIR    = "/var/tmp/oui-supervisor"
+SUPERVISOR_STATUS = SUPERVISOR_DIR + "/status.json"
+SUPERVISOR_STALE  = 10   # secs without a snapshot before the supervisor counts as gone
 
 def read_text(path: str) -> str:
     if not os.path.exists(path):
@@ -29,14 +40,29 @@ def load_json(path: str) -> dict:
     except json.JSONDecodeError:
         return {}
 
-def save_json(path: str, data: dict):
+def save_json(path: str, data: dict, indent: Optional[int] = 2):
     # Atomic write for safety
     tmp_path = path + ".tmp"
     with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+        json.dump(data, f, indent=indent)
     os.replace(tmp_path, path)
 
+def supervisor_status() -> dict:
+    """
+    Latest snapshot written by supervisor.py, or {} if it is missing or stale.
+    """
+    status = load_json(SUPERVISOR_STATUS)
+    if time.time() - status.get("updated", 0) > SUPERVISOR_STALE:
+        return {}
+    return status
+
 def restart_opencanary():
+    # Hand the restart to the supervisor (it waits for the ports to come up);
+    # only fall back to doing it inline when no supervisor is running.
+    if supervisor_status():
+        with open(SUPERVISOR_DIR + "/restart-opencanary", "w") as f:
+            f.write(str(time.time()))
+        return
     subprocess.run(["pkill", "-f", "opencanaryd"], check=False)
     subprocess.Popen(["opencanaryd", "--start", "-f"])
     time.sleep(1)
@@ -21,28 +21,9 @@ if [ ! -f /etc/opencanaryd/opencanary.conf ]; then
   mv /tmp/tmpconf /etc/opencanaryd/opencanary.conf
 fi
 
-# ── Optional custom rsyslog config ───────────────────────────────────────────
-if [ -f /app/rsyslog-opencanary.conf ]; then
-  echo "[init] custom rsyslog config found, installing"
-  cp /app/rsyslog-opencanary.conf /etc/rsyslog.d/opencanary.conf
-  echo "[init] starting rsyslog"
-  if command -v systemctl >/dev/null; then
-    systemctl restart rsyslog || true
-  elif command -v service >/dev/null; then
-    service rsyslog restart || true
-  else
-    rsyslogd || true
-  fi
-fi
-
-# ── Start helper scripts in background (tini will reap) ──────────────────────
-[ -x /opt/streamlit/rsyslog-watcher.sh ] && /opt/streamlit/rsyslog-watcher.sh >/dev/null 2>&1 &
-[ -x /opt/streamlit/alert.sh ]           && /opt/streamlit/alert.sh           >/dev/null 2>&1 &
-[ -x /opt/streamlit/log_man.sh ]         && /opt/streamlit/log_man.sh         >/dev/null 2>&1 &
-[ -x /opt/streamlit/portscan_patch.sh ]  && /opt/streamlit/portscan_patch.sh  >/dev/null 2>&1 &
-
-# ── Start OpenCanary in background ───────────────────────────────────────────
-opencanaryd --start -f >/dev/null 2>&1 &
+# ── Background services: opencanaryd, rsyslog, alerting, retention and the
+#    portscan mod are started and watched by supervisor.py (tini will reap) ──
+python3 -u /opt/streamlit/supervisor.py >/tmp/supervisor.log 2>&1 &
 
 # ── Streamlit in foreground (container stays alive) ──────────────────────────
 PORT="${MA_PORT:-8501}"